@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from synthetic_school import generate_school
+from timetable_generator import ScheduleManager, SOLVERS
+
+SIZES = {
+    "small": {"pupils": 200, "groups": 40, "teachers": 20, "rooms": 20, "subjects": 8},
+    "medium": {"pupils": 800, "groups": 160, "teachers": 60, "rooms": 60, "subjects": 12},
+    "large": {"pupils": 1500, "groups": 400, "teachers": 120, "rooms": 100, "subjects": 16},
+}
+
+def benchmark_size(path, solver="greedy", time_budget=None, seed=0, jobs=None):
+    timings = {}
+
+    start = time.perf_counter()
+    schedule_manager = ScheduleManager(path, solver=solver)
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    schedule_manager.compat_manager.get_matrix()
+    timings["compatibility"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = schedule_manager.assign_slots(time_budget=time_budget, seed=seed, jobs=jobs)
+    timings["assign_slots"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    schedule_manager.get_schedule_rows()
+    timings["classrooms"] = time.perf_counter() - start
+
+    save_report = schedule_manager.save_to_table()
+    timings["save"] = save_report["write_seconds"]
+    schedule_manager.close()
+    return {"timings": timings, "result": result.to_dict(), "rows": save_report["rows"]}
+
+def run_benchmark(sizes=("small", "medium"), solver="greedy", time_budget=None, seed=0, jobs=None, overlap=0.1):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in sizes:
+            params = dict(SIZES[name], overlap=overlap, seed=seed)
+            path = os.path.join(directory, f"{name}.db")
+            generate_school(path, **params)
+            run = benchmark_size(path, solver, time_budget, seed, jobs)
+            results.append(dict(run, size=name, params=params, solver=solver))
+    return {"python": platform.python_version(), "platform": platform.platform(), "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each phase of timetable generation on synthetic schools")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    parser.add_argument("--solver", choices=SOLVERS, default="greedy")
+    parser.add_argument("--time-budget", type=float, default=None)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--overlap", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.solver, args.time_budget, args.seed, args.jobs, args.overlap)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Subcommands import their modules inside the handler so `validate` or
+# `export` never pay for the solver, and nothing here needs tkinter.
+
+class Reporter:
+    def __init__(self, as_json):
+        self.as_json = as_json
+        self.last = 0.0
+
+    def emit(self, event, **fields):
+        if self.as_json:
+            print(json.dumps(dict(fields, event=event)), flush=True)
+        elif event == "progress":
+            print(f"{fields['phase']}: {fields['done']}/{fields['total']}", file=sys.stderr, flush=True)
+        else:
+            print(f"{event}: {json.dumps(fields)}", file=sys.stderr, flush=True)
+
+    def progress(self, phase):
+        def report(done, total):
+            now = time.perf_counter()
+            if now - self.last >= 0.5 or done == total:
+                self.last = now
+                self.emit("progress", phase=phase, done=done, total=total)
+        return report
+
+def run_generate(args, reporter):
+    from timetable_generator import GenerationCancelled, ScheduleManager
+    profiler = None
+    if args.profile:
+        from instrumentation import Profiler
+        profiler = Profiler()
+
+    schedule_manager = ScheduleManager(args.database, solver=args.solver, lessons_per_group=args.lessons_per_group, profiler=profiler)
+    try:
+        reporter.emit("phase", phase="assign_slots", solver=args.solver)
+        try:
+            result = schedule_manager.assign_slots(time_budget=args.time_budget, seed=args.seed, jobs=args.jobs, progress=reporter.progress("assign_slots"))
+        except (GenerationCancelled, KeyboardInterrupt):
+            reporter.emit("cancelled")
+            return 130
+        reporter.emit("solved", **result.to_dict())
+
+        if args.backup == "full":
+            backup_path = os.path.splitext(args.database)[0] + "_backup.db"
+            reporter.emit("phase", phase="backup", path=backup_path)
+            schedule_manager.db_manager.backup(backup_path, pages=args.backup_pages, progress=reporter.progress("backup"))
+        elif args.backup == "schedule":
+            reporter.emit("phase", phase="backup", mode="schedule")
+            reporter.emit("snapshot", rows=schedule_manager.db_manager.snapshot_schedule())
+
+        reporter.emit("phase", phase="save")
+        save_report = schedule_manager.save_to_table(compile_to=args.compile)
+        reporter.emit("saved", rows=save_report["rows"], seconds=save_report["seconds"], unmatched_slots=len(save_report["unmatched_slots"]))
+        if args.compile:
+            reporter.emit("compiled", **save_report["compiled"])
+    finally:
+        schedule_manager.close()
+
+    if profiler is not None:
+        reporter.emit("profile", **profiler.report())
+    return 0
+
+def run_restore(args, reporter):
+    from timetable_generator import DatabaseManager
+    try:
+        rows = DatabaseManager(args.database).restore_schedule_snapshot()
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    reporter.emit("restored", rows=rows)
+    return 0
+
+def run_validate(args, reporter):
+    from validator import validate
+    report = validate(args.database)
+    if args.summary:
+        report.pop("violations")
+    reporter.emit("validated", **report)
+    return 0 if report["valid"] else 1
+
+def run_export(args, reporter):
+    from exporter import export_schedules
+    from timetable_generator import DatabaseManager
+    db_manager = DatabaseManager(args.database)
+    report = export_schedules(db_manager, args.category, args.output_dir, args.mode, progress=reporter.progress("export"))
+    reporter.emit("exported", **report)
+    return 0
+
+def run_benchmark(args, reporter):
+    from benchmark import run_benchmark as benchmark
+    report = benchmark(args.sizes, args.solver, args.time_budget, args.seed, args.jobs, args.overlap)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    reporter.emit("benchmarked", **report)
+    return 0
+
+def build_parser():
+    # Choices are spelled out here rather than imported so building the
+    # parser stays import-free.
+    parser = argparse.ArgumentParser(description="Headless timetable generator")
+    parser.add_argument("--json", action="store_true", help="write progress and results as JSON lines on stdout")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="generate and save a timetable")
+    generate.add_argument("database")
+    generate.add_argument("--solver", choices=["greedy", "dsatur", "parallel", "components"], default="dsatur")
+    generate.add_argument("--jobs", type=int, default=None)
+    generate.add_argument("--time-budget", type=float, default=None, help="seconds")
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("--lessons-per-group", type=int, default=None)
+    generate.add_argument("--backup", choices=["full", "schedule", "none"], default="full", help="copy the whole database, or only snapshot the Schedule table")
+    generate.add_argument("--backup-pages", type=int, default=256, help="pages copied per step of a full backup")
+    generate.add_argument("--profile", action="store_true")
+    generate.add_argument("--compile", metavar="PATH", help="also write a compiled lookup file for timetable_file.TimetableFile")
+    generate.set_defaults(handler=run_generate)
+
+    restore = subparsers.add_parser("restore", help="put back the timetable saved by --backup schedule")
+    restore.add_argument("database")
+    restore.set_defaults(handler=run_restore)
+
+    validate = subparsers.add_parser("validate", help="check a saved timetable")
+    validate.add_argument("database")
+    validate.add_argument("--summary", action="store_true")
+    validate.set_defaults(handler=run_validate)
+
+    export = subparsers.add_parser("export", help="export every pupil's or teacher's timetable")
+    export.add_argument("database")
+    export.add_argument("--category", choices=["Pupil", "Teacher"], default="Pupil")
+    export.add_argument("--mode", choices=["files", "combined", "zip"], default="files")
+    export.add_argument("--output-dir", default="Exports")
+    export.set_defaults(handler=run_export)
+
+    benchmark = subparsers.add_parser("benchmark", help="time the pipeline on synthetic schools")
+    benchmark.add_argument("--sizes", nargs="+", choices=["small", "medium", "large"], default=["small", "medium"])
+    benchmark.add_argument("--solver", choices=["greedy", "dsatur", "parallel", "components"], default="greedy")
+    benchmark.add_argument("--jobs", type=int, default=None)
+    benchmark.add_argument("--time-budget", type=float, default=None, help="seconds")
+    benchmark.add_argument("--overlap", type=float, default=0.1)
+    benchmark.add_argument("--seed", type=int, default=0)
+    benchmark.add_argument("--output")
+    benchmark.set_defaults(handler=run_benchmark)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "database", None) is not None and not os.path.exists(args.database):
+        print(f"Database {args.database} does not exist", file=sys.stderr)
+        return 2
+    return args.handler(args, Reporter(args.json))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,86 +1,164 @@
 import sqlite3
+import sys
 
 filename = "schooldb.db"
-conn = sqlite3.connect(filename)
-cursor = conn.cursor()
-
-cursor.execute("""
-    CREATE TABLE Period (
-    PeriodID     NUMERIC PRIMARY KEY
-                         UNIQUE
-                         NOT NULL,
-    Day          NUMERIC,
-    PeriodNumber NUMERIC
-);
-""")
-
-cursor.execute("""
-CREATE TABLE Subject (
-    SubjectID   NUMERIC PRIMARY KEY
-                        UNIQUE
-                        NOT NULL,
-    SubjectName TEXT
-);
-""")
-
-cursor.execute("""
-    CREATE TABLE Teacher (
-    TeacherID NUMERIC PRIMARY KEY
-                      UNIQUE
-                      NOT NULL,
-    FirstName TEXT,
-    LastName  TEXT
-);
-""")
-
-cursor.execute("""
-    CREATE TABLE TeacherSubject (
-    TeacherID  REFERENCES Teacher (TeacherID),
-    SubjectID  REFERENCES Subject (SubjectID) 
-);
-""")
-
-cursor.execute("""
-    CREATE TABLE Pupil (
-    PupilID   NUMERIC PRIMARY KEY
-                      UNIQUE
-                      NOT NULL,
-    FirstName TEXT,
-    LastName  TEXT,
-    YearGroup NUMERIC
-);
-""")
-
-cursor.execute("""
-    CREATE TABLE [Group] (
-    GroupID   NUMERIC PRIMARY KEY
-                      NOT NULL
-                      UNIQUE,
-    TeacherID NUMERIC REFERENCES Teacher (TeacherID),
-    SubjectID NUMERIC REFERENCES Subject (SubjectID) 
-);
-""")
-
-cursor.execute("""
-    CREATE TABLE PupilGroup (
-    GroupID NUMERIC REFERENCES [Group] (GroupID),
-    PupilID NUMERIC REFERENCES Pupil (PupilID) 
-);
-""")
-
-cursor.execute("""
-    CREATE TABLE Classroom (
-    ClassroomID NUMERIC PRIMARY KEY
-                        UNIQUE
-                        NOT NULL,
-    SubjectID   NUMERIC REFERENCES Subject (SubjectID) 
-);
-""")
-
-cursor.execute("""
-    CREATE TABLE Schedule (
-    PeriodID    NUMERIC REFERENCES Period (PeriodID),
-    GroupID     NUMERIC REFERENCES [Group] (GroupID),
-    ClassroomID NUMERIC REFERENCES Classroom (ClassroomID) 
-);
-""")
\ No newline at end of file
+
+# Each migration is applied once, in order, and recorded in PRAGMA
+# user_version, so existing databases pick up new indexes without being
+# recreated.
+MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS PupilGroupByPupil ON PupilGroup (PupilID, GroupID)",
+        "CREATE INDEX IF NOT EXISTS GroupByTeacher ON [Group] (TeacherID, GroupID, SubjectID)",
+        "CREATE INDEX IF NOT EXISTS ScheduleByGroup ON Schedule (GroupID, PeriodID, ClassroomID)",
+        "CREATE INDEX IF NOT EXISTS ScheduleByPeriod ON Schedule (PeriodID, GroupID, ClassroomID)",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Queries run by DatabaseManager and ScheduleManager with parameters.
+# HOT_QUERIES checks the same strings, with one ID in each IN list.
+PUPIL_SCHEDULE_QUERY = "SELECT PeriodID, 'Group'.GroupID, ClassroomID, 'Group'.SubjectID FROM PupilGroup JOIN Schedule ON Schedule.GroupID = PupilGroup.GroupID JOIN 'Group' ON PupilGroup.GroupID = 'Group'.GroupID WHERE PupilGroup.PupilID IN ({})"
+TEACHER_SCHEDULE_QUERY = "SELECT PeriodID, 'Group'.GroupID, ClassroomID, 'Group'.SubjectID FROM 'Group' JOIN Schedule ON Schedule.GroupID = 'Group'.GroupID WHERE 'Group'.TeacherID IN ({})"
+SAVED_SCHEDULE_QUERY = "SELECT PeriodID, GroupID, ClassroomID FROM Schedule ORDER BY PeriodID, rowid"
+DELETE_LESSON_QUERY = "DELETE FROM Schedule WHERE PeriodID = ? AND GroupID = ?"
+
+HOT_QUERIES = {
+    "pupil_schedule": PUPIL_SCHEDULE_QUERY.format("?"),
+    "teacher_schedule": TEACHER_SCHEDULE_QUERY.format("?"),
+    "saved_schedule": SAVED_SCHEDULE_QUERY,
+    "delete_lesson": DELETE_LESSON_QUERY,
+}
+
+def create_schema(conn):
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE Period (
+        PeriodID     NUMERIC PRIMARY KEY
+                             UNIQUE
+                             NOT NULL,
+        Day          NUMERIC,
+        PeriodNumber NUMERIC
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE Subject (
+        SubjectID   NUMERIC PRIMARY KEY
+                            UNIQUE
+                            NOT NULL,
+        SubjectName TEXT
+    );
+    """)
+
+    cursor.execute("""
+        CREATE TABLE Teacher (
+        TeacherID NUMERIC PRIMARY KEY
+                          UNIQUE
+                          NOT NULL,
+        FirstName TEXT,
+        LastName  TEXT
+    );
+    """)
+
+    cursor.execute("""
+        CREATE TABLE TeacherSubject (
+        TeacherID  REFERENCES Teacher (TeacherID),
+        SubjectID  REFERENCES Subject (SubjectID) 
+    );
+    """)
+
+    cursor.execute("""
+        CREATE TABLE Pupil (
+        PupilID   NUMERIC PRIMARY KEY
+                          UNIQUE
+                          NOT NULL,
+        FirstName TEXT,
+        LastName  TEXT,
+        YearGroup NUMERIC
+    );
+    """)
+
+    cursor.execute("""
+        CREATE TABLE [Group] (
+        GroupID   NUMERIC PRIMARY KEY
+                          NOT NULL
+                          UNIQUE,
+        TeacherID NUMERIC REFERENCES Teacher (TeacherID),
+        SubjectID NUMERIC REFERENCES Subject (SubjectID) 
+    );
+    """)
+
+    cursor.execute("""
+        CREATE TABLE PupilGroup (
+        GroupID NUMERIC REFERENCES [Group] (GroupID),
+        PupilID NUMERIC REFERENCES Pupil (PupilID) 
+    );
+    """)
+
+    cursor.execute("""
+        CREATE TABLE Classroom (
+        ClassroomID NUMERIC PRIMARY KEY
+                            UNIQUE
+                            NOT NULL,
+        SubjectID   NUMERIC REFERENCES Subject (SubjectID) 
+    );
+    """)
+
+    cursor.execute("""
+        CREATE TABLE Schedule (
+        PeriodID    NUMERIC REFERENCES Period (PeriodID),
+        GroupID     NUMERIC REFERENCES [Group] (GroupID),
+        ClassroomID NUMERIC REFERENCES Classroom (ClassroomID) 
+    );
+    """)
+
+    migrate(conn)
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    version = get_schema_version(conn)
+    applied = []
+    for target, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(target)
+    return applied
+
+def explain_query(conn, query):
+    params = (None,) * query.count("?")
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+
+def check_query_plans(conn):
+    # A query passes when no step of its plan is a plain table scan.
+    report = {}
+    for name, query in HOT_QUERIES.items():
+        plan = explain_query(conn, query)
+        full_scans = [step for step in plan if step.startswith("SCAN") and "INDEX" not in step]
+        report[name] = {"plan": plan, "uses_index": not full_scans}
+    return report
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "migrate":
+        conn = sqlite3.connect(sys.argv[2])
+        print(f"Applied migrations: {migrate(conn) or 'none'}")
+        for name, result in check_query_plans(conn).items():
+            status = "ok" if result["uses_index"] else "FULL SCAN"
+            print(f"{name}: {status} ({'; '.join(result['plan'])})")
+    else:
+        conn = sqlite3.connect(filename)
+        create_schema(conn)
+    conn.close()
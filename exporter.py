@@ -0,0 +1,63 @@
+import csv
+import io
+import os
+import zipfile
+from itertools import groupby
+
+EXPORT_FIELDS = ["PeriodID", "GroupID", "ClassroomID", "SubjectID"]
+EXPORT_MODES = ("files", "combined", "zip")
+
+def export_filename(category, person_id, first_name, last_name):
+    return f"{category}{person_id}{last_name}{first_name}.csv"
+
+def write_schedule(csvfile, rows):
+    writer = csv.writer(csvfile)
+    writer.writerow(EXPORT_FIELDS)
+    writer.writerows(rows)
+
+def export_schedules(db_manager, category, export_dir="Exports", mode="files", progress=None):
+    # Streams every schedule for the category from one ordered query and
+    # writes each person's rows as soon as their block ends, so memory use is
+    # one person's week regardless of school size.
+    if mode not in EXPORT_MODES:
+        raise ValueError(f"Unknown export mode {mode!r}, expected one of {EXPORT_MODES}")
+    os.makedirs(export_dir, exist_ok=True)
+    total = db_manager.count_people(category)
+    people = 0
+    rows_written = 0
+
+    if mode == "combined":
+        path = os.path.join(export_dir, f"{category}Schedules.csv")
+        output = open(path, "w", newline="")
+        combined = csv.writer(output)
+        combined.writerow([f"{category}ID", "FirstName", "LastName"] + EXPORT_FIELDS)
+    elif mode == "zip":
+        path = os.path.join(export_dir, f"{category}Schedules.zip")
+        output = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+    else:
+        path = export_dir
+        output = None
+
+    try:
+        rows = db_manager.iter_all_schedules(category)
+        for (person_id, first_name, last_name), person_rows in groupby(rows, key=lambda row: row[:3]):
+            schedule = [row[3:] for row in person_rows]
+            filename = export_filename(category, person_id, first_name, last_name)
+            if mode == "combined":
+                combined.writerows([(person_id, first_name, last_name) + row for row in schedule])
+            elif mode == "zip":
+                buffer = io.StringIO(newline="")
+                write_schedule(buffer, schedule)
+                output.writestr(filename, buffer.getvalue())
+            else:
+                with open(os.path.join(export_dir, filename), "w", newline="") as csvfile:
+                    write_schedule(csvfile, schedule)
+            people += 1
+            rows_written += len(schedule)
+            if progress is not None:
+                progress(people, total)
+    finally:
+        if output is not None:
+            output.close()
+
+    return {"people": people, "rows": rows_written, "path": path}
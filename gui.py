@@ -1,9 +1,46 @@
 import tkinter as tk
-from tkinter import filedialog, ttk
+from tkinter import filedialog, messagebox, ttk
 from ttkwidgets.autocomplete import AutocompleteCombobox
 import os
 import csv
-from timetable_generator import ScheduleManager, DatabaseManager
+import queue
+import threading
+import time
+import ddl
+from timetable_generator import ScheduleManager, DatabaseManager, GenerationCancelled
+from exporter import export_filename, export_schedules
+from instrumentation import Profiler
+from validator import validate
+
+BATCH_EXPORT_MODES = {"Separate files": "files", "Combined CSV": "combined", "ZIP archive": "zip"}
+
+class NameCombobox(AutocompleteCombobox):
+    # Completes from a NameIndex (a binary search per key press) instead of
+    # scanning the whole completion list like AutocompleteCombobox does.
+    def __init__(self, master=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.name_index = None
+
+    def set_name_index(self, name_index):
+        self.name_index = name_index
+        self.set_completion_list(name_index.names())
+
+    def autocomplete(self, delta=0):
+        if self.name_index is None:
+            return super().autocomplete(delta)
+        if delta:
+            self.delete(self.position, tk.END)
+        else:
+            self.position = len(self.get())
+        hits = self.name_index.complete(self.get())
+        if hits != self._hits:
+            self._hit_index = 0
+            self._hits = hits
+        if self._hits:
+            self._hit_index = (self._hit_index + delta) % len(self._hits)
+            self.delete(0, tk.END)
+            self.insert(0, self._hits[self._hit_index])
+            self.select_range(self.position, tk.END)
 
 class ExportWindow:
     def __init__(self, master, db_file):
@@ -21,7 +58,7 @@ class ExportWindow:
         self.category_combobox.bind("<<ComboboxSelected>>", self.populate_items)
         self.category_var = tk.StringVar()
 
-        self.item_combobox = AutocompleteCombobox(master)
+        self.item_combobox = NameCombobox(master)
         self.item_combobox.pack()
 
         self.category_combobox.set_completion_list(["Pupil", "Teacher"])
@@ -30,6 +67,10 @@ class ExportWindow:
         self.export_button = tk.Button(master, text="Export", command=self.export_data)
         self.export_button.pack()
 
+        self.batch_mode_combobox = ttk.Combobox(master, values=list(BATCH_EXPORT_MODES), state="readonly")
+        self.batch_mode_combobox.current(0)
+        self.batch_mode_combobox.pack()
+
         self.batch_export_button = tk.Button(master, text="Batch Export", command=self.batch_export_data)
         self.batch_export_button.pack()
 
@@ -38,29 +79,29 @@ class ExportWindow:
 
     def populate_items(self, event=None):
         selected_category = self.category_combobox.get()
-        if selected_category == "Pupil":
-            pupil_names = self.db_manager.get_pupil_names()
-            self.item_combobox.set_completion_list(pupil_names)
-
-        elif selected_category == "Teacher":
-            teacher_names = self.db_manager.get_teacher_names()
-            self.item_combobox.set_completion_list(teacher_names)
+        if selected_category in ("Pupil", "Teacher"):
+            self.item_combobox.set_name_index(self.db_manager.get_name_index(selected_category))
 
     def export_data(self):
         selected_category = self.category_combobox.get()
         selected_item = self.item_combobox.get()
 
-        if selected_category == "Pupil":
-            pupil_id = self.db_manager.get_pupil_id(selected_item)
-            first_name, last_name = selected_item.split()
-            default_filename = f"Pupil{pupil_id}{last_name}{first_name}.csv"
-            schedule_data = self.db_manager.get_pupil_schedule(selected_item)
+        if selected_category not in ("Pupil", "Teacher"):
+            self.export_status_label.config(text="Select a category first")
+            return
+
+        try:
+            person_id = self.db_manager.get_person_id(selected_category, selected_item)
+        except ValueError as error:
+            self.export_status_label.config(text=str(error))
+            return
 
-        elif selected_category == "Teacher":
-            teacher_id = self.db_manager.get_teacher_id(selected_item)
-            first_name, last_name = selected_item.split()
-            default_filename = f"Teacher{teacher_id}{last_name}{first_name}.csv"
-            schedule_data = self.db_manager.get_teacher_schedule(selected_item)
+        first_name, last_name = self.db_manager.get_name_index(selected_category).record(person_id)
+        default_filename = export_filename(selected_category, person_id, first_name, last_name)
+        if selected_category == "Pupil":
+            schedule_data = self.db_manager.get_schedule_by_ids(ddl.PUPIL_SCHEDULE_QUERY, [person_id])
+        else:
+            schedule_data = self.db_manager.get_schedule_by_ids(ddl.TEACHER_SCHEDULE_QUERY, [person_id])
 
         if schedule_data:
 
@@ -84,19 +125,18 @@ class ExportWindow:
         
     def batch_export_data(self):
         selected_category = self.category_combobox.get()
-        items = []
-
-        if selected_category == "Pupil":
-            items = self.db_manager.get_pupil_names()
-        elif selected_category == "Teacher":
-            items = self.db_manager.get_teacher_names()
+        if selected_category not in ("Pupil", "Teacher"):
+            self.export_status_label.config(text="Select a category first")
+            return
 
-        print(items)
+        mode = BATCH_EXPORT_MODES[self.batch_mode_combobox.get()]
+        report = export_schedules(self.db_manager, selected_category, "Exports", mode, progress=self.update_export_progress)
+        self.export_status_label.config(text=f"Exported Schedules for {report['people']} {selected_category}s")
 
-        for item in items:
-            self.item_combobox.set(item)
-            self.export_data()
-        self.export_status_label.config(text=f"Exported Schedules for all {selected_category}s")
+    def update_export_progress(self, done, total):
+        if done % 50 == 0 or done == total:
+            self.export_status_label.config(text=f"Exporting... {done}/{total}")
+            self.master.update_idletasks()
 
 
 class TimetableGeneratorApp:
@@ -113,12 +153,30 @@ class TimetableGeneratorApp:
         self.select_button = tk.Button(self.frame, text="Select Database File", command=self.select_file)
         self.select_button.grid(row=0, column=1, padx=10)
 
+        self.profile_var = tk.BooleanVar()
+        self.profile_checkbox = tk.Checkbutton(self.frame, text="Profile run", variable=self.profile_var)
+        self.profile_checkbox.grid(row=1, column=1, sticky="w", padx=10)
+
+        self.schedule_backup_var = tk.BooleanVar()
+        self.schedule_backup_checkbox = tk.Checkbutton(self.frame, text="Back up timetable only", variable=self.schedule_backup_var)
+        self.schedule_backup_checkbox.grid(row=1, column=2, sticky="w")
+
         self.export_button = tk.Button(master, text="Export Data", command=self.open_export_window)
         self.export_button.pack(side="right", padx=15)
 
+        self.restore_button = tk.Button(master, text="Restore Timetable", command=self.restore_timetable)
+        self.restore_button.pack(side="right")
+
         self.generate_button = tk.Button(master, text="Generate Timetable", command=self.generate_timetable)
         self.generate_button.pack(side="left", padx=25)
 
+        self.cancel_button = tk.Button(master, text="Cancel", command=self.cancel_generation, state="disabled")
+        self.cancel_button.pack(side="left")
+
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
+
         self.progress_label = tk.Label(master, text="")
         self.progress_label.pack(side="left", pady=25)
 
@@ -130,19 +188,16 @@ class TimetableGeneratorApp:
         self.update_progress("Selected File! Click 'Generate' to begin")
         self.flash_component(self.generate_button, "lime", 2)
 
-    def create_backup(self, path):
+    def create_backup(self, path, progress=None, schedule_only=False):
+        db_manager = DatabaseManager(path)
+        if schedule_only:
+            db_manager.snapshot_schedule()
+            return
+
         backup_name = os.path.splitext(os.path.basename(path))[0] + "_backup.db"
         directory = os.path.dirname(path)
         backup_path = os.path.join(directory, backup_name)
-
-        if os.path.exists(backup_path):
-            os.remove(backup_path)
-
-        with open(path, 'rb') as file:
-            content = file.read()
-
-            with open(backup_path, 'wb') as backup:
-                backup.write(content)
+        db_manager.backup(backup_path, progress=progress)
 
     def generate_timetable(self):
         db_path = self.selected_file_textbox.get()
@@ -159,20 +214,122 @@ class TimetableGeneratorApp:
             self.flash_component(self.selected_file_textbox, "red", 2)
             return
 
-        schedule_manager = ScheduleManager(db_path)
+        if self.worker is not None and self.worker.is_alive():
+            return
 
+        self.cancel_event.clear()
+        self.generate_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
         self.update_progress("Generating timetable...")
-        schedule_manager.assign_slots()
-
-        self.update_progress("Creating Backup...")
-        self.create_backup(db_path)
+        profiler = Profiler() if self.profile_var.get() else None
+        schedule_only = self.schedule_backup_var.get()
+        self.worker = threading.Thread(target=self.run_generation, args=(db_path, profiler, schedule_only), daemon=True)
+        self.worker.start()
+        self.master.after(100, self.poll_generation)
+
+    def run_generation(self, db_path, profiler=None, schedule_only=False):
+        # Runs on the worker thread: it must only talk to Tk through the queue.
+        schedule_manager = None
+        start = time.perf_counter()
+        last_report = [0.0]
+
+        def report_progress(done, total):
+            now = time.perf_counter()
+            if now - last_report[0] >= 0.1 or done == total:
+                last_report[0] = now
+                self.progress_queue.put(("progress", done, total, now - start))
+
+        try:
+            schedule_manager = ScheduleManager(db_path, profiler=profiler)
+            schedule_manager.assign_slots(progress=report_progress, cancel=self.cancel_event)
+
+            self.progress_queue.put(("status", "Creating Backup..."))
+            self.create_backup(db_path, lambda done, total: self.progress_queue.put(("status", f"Creating Backup... {done}/{total} pages")), schedule_only)
+            if self.cancel_event.is_set():
+                raise GenerationCancelled()
+
+            # save_to_table writes in one transaction, so once it starts it is
+            # no longer cancellable and Schedule is never left half-written.
+            self.progress_queue.put(("saving",))
+            save_report = schedule_manager.save_to_table()
+            save_report["violations"] = sum(validate(db_path)["counts"].values())
+            self.progress_queue.put(("done", save_report, profiler))
+        except GenerationCancelled:
+            self.progress_queue.put(("cancelled",))
+        except Exception as error:
+            self.progress_queue.put(("error", str(error)))
+        finally:
+            if schedule_manager is not None:
+                schedule_manager.close()
+
+    def poll_generation(self):
+        finished = False
+        while True:
+            try:
+                message = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            kind = message[0]
+            if kind == "progress":
+                done, total, elapsed = message[1:]
+                eta = elapsed / done * (total - done) if done else 0
+                self.progress_label.config(text=f"Generating... {done}/{total} (ETA {eta:.0f}s)")
+            elif kind == "status":
+                self.progress_label.config(text=message[1])
+            elif kind == "saving":
+                self.cancel_button.config(state="disabled")
+                self.progress_label.config(text="Saving...")
+            elif kind == "done":
+                save_report, profiler = message[1:]
+                message_text = f"Complete! Saved {save_report['rows']} lessons in {save_report['seconds']:.2f}s"
+                if save_report["unmatched_slots"]:
+                    message_text += f" ({len(save_report['unmatched_slots'])} periods short of rooms)"
+                if save_report["violations"]:
+                    message_text += f" ({save_report['violations']} clashes found)"
+                self.progress_label.config(text=message_text)
+                self.flash_component(self.master, "lime", 2)
+                self.flash_component(self.frame, "lime", 2)
+                if profiler is not None:
+                    messagebox.showinfo("Run profile", profiler.summary(), parent=self.master)
+                finished = True
+            elif kind == "cancelled":
+                self.progress_label.config(text="Generation cancelled, timetable unchanged")
+                finished = True
+            elif kind == "error":
+                self.progress_label.config(text=f"Generation failed: {message[1]}")
+                self.flash_component(self.master, "red", 2)
+                finished = True
+
+        if finished:
+            self.generate_button.config(state="normal")
+            self.cancel_button.config(state="disabled")
+        else:
+            self.master.after(100, self.poll_generation)
+
+    def cancel_generation(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state="disabled")
+        self.progress_label.config(text="Cancelling...")
+
+    def restore_timetable(self):
+        db_path = self.selected_file_textbox.get()
+        if db_path == "" or not os.path.exists(db_path):
+            self.update_progress("Please select a file")
+            self.master.after(800, lambda: self.update_progress("Select a Database File"))
+            self.flash_component(self.select_button, "yellow", 2)
+            return
 
-        self.update_progress("Saving...")
-        schedule_manager.save_to_table()
+        if self.worker is not None and self.worker.is_alive():
+            return
 
-        self.update_progress("Complete!")
-        self.flash_component(self.master, "lime", 2)
-        self.flash_component(self.frame, "lime", 2)
+        if not messagebox.askyesno("Restore Timetable", "Replace the current timetable with the one saved by the last timetable-only backup?", parent=self.master):
+            return
+        try:
+            rows = DatabaseManager(db_path).restore_schedule_snapshot()
+        except ValueError as error:
+            self.update_progress(str(error))
+            return
+        self.update_progress(f"Restored {rows} lessons from the timetable backup")
 
     def open_export_window(self):
         db_path = self.selected_file_textbox.get()
@@ -204,7 +361,7 @@ class TimetableGeneratorApp:
 
 def main():
     root = tk.Tk()
-    root.geometry("500x125")
+    root.geometry("500x150")
     root.resizable(False, False)
     app = TimetableGeneratorApp(root)
     app.update_progress("Select a Database File")
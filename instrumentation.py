@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+class Profiler:
+    # Collects connection/statement counts, time per SQL statement and time
+    # per named phase. Nothing in DatabaseManager or ScheduleManager touches
+    # it unless one is passed in, so a run without a profiler pays nothing.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.statements = 0
+        self.queries = {}
+        self.phases = {}
+
+    def on_connect(self, conn):
+        with self.lock:
+            self.connections += 1
+        conn.set_trace_callback(self.trace)
+        return ProfiledConnection(conn, self)
+
+    def trace(self, sql):
+        with self.lock:
+            self.statements += 1
+
+    def record_query(self, sql, seconds):
+        with self.lock:
+            entry = self.queries.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_query_time(self, sql, seconds):
+        with self.lock:
+            self.queries.setdefault(sql, [0, 0.0])[1] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                entry = self.phases.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+
+    def report(self):
+        with self.lock:
+            queries = {sql: {"count": count, "seconds": seconds} for sql, (count, seconds) in self.queries.items()}
+            phases = {name: {"count": count, "seconds": seconds} for name, (count, seconds) in self.phases.items()}
+            return {
+                "connections": self.connections,
+                "statements": self.statements,
+                "sql_seconds": sum(query["seconds"] for query in queries.values()),
+                "phases": phases,
+                "queries": queries,
+            }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.report(), indent=indent)
+
+    def summary(self, top=5):
+        report = self.report()
+        lines = [f"{report['connections']} connections, {report['statements']} statements, {report['sql_seconds']:.3f}s in SQL"]
+        for name, phase in sorted(report["phases"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"{name}: {phase['seconds']:.3f}s ({phase['count']}x)")
+        slowest = sorted(report["queries"].items(), key=lambda item: -item[1]["seconds"])[:top]
+        for sql, query in slowest:
+            text = sql if len(sql) <= 60 else sql[:57] + "..."
+            lines.append(f"{query['seconds']:.3f}s {query['count']}x {text}")
+        return "\n".join(lines)
+
+class ProfiledConnection:
+    def __init__(self, conn, profiler):
+        self.conn = conn
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def __enter__(self):
+        self.conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.conn.__exit__(exc_type, exc_value, traceback)
+
+    def cursor(self):
+        return ProfiledCursor(self.conn.cursor(), self.profiler)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, rows):
+        return self.cursor().executemany(sql, rows)
+
+class ProfiledCursor:
+    # Fetch time is added to the statement that produced the rows, since
+    # SQLite does most of the work of a SELECT while stepping through them.
+    def __init__(self, cursor, profiler):
+        self.cursor = cursor
+        self.profiler = profiler
+        self.sql = None
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def timed(self, sql, method, *args):
+        self.sql = sql
+        start = time.perf_counter()
+        try:
+            method(sql, *args)
+        finally:
+            self.profiler.record_query(sql, time.perf_counter() - start)
+        return self
+
+    def execute(self, sql, params=()):
+        return self.timed(sql, self.cursor.execute, params)
+
+    def executemany(self, sql, rows):
+        return self.timed(sql, self.cursor.executemany, rows)
+
+    def fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self.sql is not None:
+                self.profiler.add_query_time(self.sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        return self.fetch(self.cursor.fetchone)
+
+    def fetchall(self):
+        return self.fetch(self.cursor.fetchall)
+
+    def fetchmany(self, size=None):
+        return self.fetch(self.cursor.fetchmany, size or self.cursor.arraysize)
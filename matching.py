@@ -0,0 +1,48 @@
+from collections import deque
+
+def hopcroft_karp(adjacency):
+    # Maximum bipartite matching. adjacency[u] lists the right-hand nodes
+    # left node u may be matched to; returns {u: right node} for every
+    # matched left node.
+    match_left = [None] * len(adjacency)
+    match_right = {}
+    infinity = len(adjacency) + 1
+
+    def bfs():
+        distance = [infinity] * len(adjacency)
+        queue = deque()
+        for u in range(len(adjacency)):
+            if match_left[u] is None:
+                distance[u] = 0
+                queue.append(u)
+        found = False
+        while queue:
+            u = queue.popleft()
+            for v in adjacency[u]:
+                w = match_right.get(v)
+                if w is None:
+                    found = True
+                elif distance[w] == infinity:
+                    distance[w] = distance[u] + 1
+                    queue.append(w)
+        return distance, found
+
+    def dfs(u, distance):
+        for v in adjacency[u]:
+            w = match_right.get(v)
+            if w is None or (distance[w] == distance[u] + 1 and dfs(w, distance)):
+                match_left[u] = v
+                match_right[v] = u
+                return True
+        distance[u] = infinity
+        return False
+
+    while True:
+        distance, found = bfs()
+        if not found:
+            break
+        for u in range(len(adjacency)):
+            if match_left[u] is None:
+                dfs(u, distance)
+
+    return {u: v for u, v in enumerate(match_left) if v is not None}
@@ -0,0 +1,373 @@
+import os
+import random
+import time
+
+class GenerationCancelled(Exception):
+    pass
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def score_slots(dataset, slots, required):
+    # Lower is better: (lessons still to place, groups without a free room).
+    counts = {group_id: 0 for group_id in dataset.group_ids}
+    room_shortfall = 0
+    for slot in slots:
+        subject_counts = {}
+        for group_id in slot:
+            counts[group_id] += 1
+            subjectid = dataset.subject_of(group_id)
+            subject_counts[subjectid] = subject_counts.get(subjectid, 0) + 1
+        for subjectid, count in subject_counts.items():
+            room_shortfall += max(0, count - dataset.available_classrooms.get(subjectid, 0))
+    unplaced = sum(max(0, required.get(group_id, 0) - count) for group_id, count in counts.items())
+    return unplaced, room_shortfall
+
+class SolverResult:
+    def __init__(self, slots, score, runs, seconds):
+        self.slots = slots
+        self.score = score
+        self.runs = runs
+        self.seconds = seconds
+
+    def to_dict(self):
+        return {"unplaced": self.score[0], "room_shortfall": self.score[1], "runs": self.runs, "seconds": self.seconds}
+
+class DSaturSolver:
+    # Places lessons one at a time, always picking the group with the fewest
+    # slots left in its domain (bitset over slots). Placing a lesson removes
+    # the slot from every clashing group's domain and, once a subject's rooms
+    # are all used, from every group of that subject (forward checking).
+    def __init__(self, dataset, matrix, num_slots, required, seed=0, group_ids=None):
+        self.dataset = dataset
+        self.num_slots = num_slots
+        self.seed = seed
+        self.group_ids = list(dataset.group_ids if group_ids is None else group_ids)
+        local_index = {matrix.group_index[group_id]: k for k, group_id in enumerate(self.group_ids)}
+        subset_mask = 0
+        for i in local_index:
+            subset_mask |= 1 << i
+
+        self.clash = []
+        for group_id in self.group_ids:
+            i = matrix.group_index[group_id]
+            row = 0
+            for j in iter_bits(matrix.all_mask & ~matrix.compatible[i] & subset_mask):
+                if j != i:
+                    row |= 1 << local_index[j]
+            self.clash.append(row)
+        self.degree = [row.bit_count() for row in self.clash]
+
+        self.subjects = [dataset.subject_of(group_id) for group_id in self.group_ids]
+        self.subject_members = {}
+        for k, subjectid in enumerate(self.subjects):
+            self.subject_members[subjectid] = self.subject_members.get(subjectid, 0) | (1 << k)
+        self.required = [required.get(group_id, 0) for group_id in self.group_ids]
+
+    def run(self, rng=None, deadline=None, cancel=None, progress=None, room_usage=None):
+        # Past the deadline the lessons placed so far are returned, with
+        # everything not yet placed counted as unplaced.
+        num_groups = len(self.group_ids)
+        full = (1 << self.num_slots) - 1
+        domain = [full] * num_groups
+        needed = list(self.required)
+        slot_groups = [0] * self.num_slots
+
+        rooms_left = []
+        for s in range(self.num_slots):
+            left = {}
+            for subjectid, members in self.subject_members.items():
+                left[subjectid] = self.dataset.available_classrooms.get(subjectid, 0)
+                if room_usage is not None:
+                    left[subjectid] -= room_usage[s].get(subjectid, 0)
+                if left[subjectid] <= 0:
+                    for k in iter_bits(members):
+                        domain[k] &= ~(1 << s)
+            rooms_left.append(left)
+
+        if rng is None:
+            rank = list(range(num_groups))
+        else:
+            rank = rng.sample(range(num_groups), num_groups)
+
+        active = [k for k in range(num_groups) if needed[k] > 0]
+        total = sum(needed)
+        done = 0
+        unplaced = 0
+        while active:
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            if deadline is not None and time.perf_counter() > deadline:
+                unplaced += sum(needed[k] for k in active)
+                break
+
+            best = min(active, key=lambda k: (domain[k].bit_count(), -needed[k], -self.degree[k], rank[k]))
+            if domain[best] == 0:
+                unplaced += needed[best]
+                done += needed[best]
+                needed[best] = 0
+                active.remove(best)
+                continue
+
+            if rng is not None and rng.random() < 0.2:
+                s = rng.choice(list(iter_bits(domain[best])))
+            else:
+                s = (domain[best] & -domain[best]).bit_length() - 1
+            slot_bit = 1 << s
+            slot_groups[s] |= 1 << best
+            domain[best] &= ~slot_bit
+            for k in iter_bits(self.clash[best]):
+                domain[k] &= ~slot_bit
+            subjectid = self.subjects[best]
+            rooms_left[s][subjectid] -= 1
+            if rooms_left[s][subjectid] == 0:
+                for k in iter_bits(self.subject_members[subjectid]):
+                    domain[k] &= ~slot_bit
+
+            needed[best] -= 1
+            if needed[best] == 0:
+                active.remove(best)
+            done += 1
+            if progress is not None:
+                progress(done, total)
+
+        slots = [[self.group_ids[k] for k in iter_bits(mask)] for mask in slot_groups]
+        return slots, unplaced
+
+    def solve(self, time_budget=None, max_runs=None, cancel=None, progress=None, room_usage=None):
+        # The first run is deterministic; with a time budget, further runs
+        # randomise tie-breaks from the seed and the best timetable is kept.
+        # Every run, the first included, stops at the deadline. Progress is
+        # reported per lesson placed, for the first run only.
+        start = time.perf_counter()
+        deadline = None if time_budget is None else start + time_budget
+        rng = random.Random(self.seed)
+        best = None
+        runs = 0
+        while True:
+            slots, unplaced = self.run(rng if runs else None, deadline, cancel, progress if not runs else None, room_usage)
+            runs += 1
+            if best is None or unplaced < best[1]:
+                best = (slots, unplaced)
+            if unplaced == 0 or deadline is None or time.perf_counter() > deadline:
+                break
+            if max_runs is not None and runs >= max_runs:
+                break
+        return SolverResult(best[0], (best[1], 0), runs, time.perf_counter() - start)
+
+worker_solver = None
+worker_stop = None
+
+def init_worker(solver, stop):
+    global worker_solver, worker_stop
+    worker_solver = solver
+    worker_stop = stop
+
+def run_attempt(attempt, seed, deadline):
+    # Attempt 0 is the deterministic run; every other attempt is seeded from
+    # seed + attempt so the same seed always replays the same attempts.
+    # deadline is wall-clock (time.time()) so it means the same thing in
+    # every process, however long the attempt waited in the queue.
+    rng = None if attempt == 0 else random.Random(seed + attempt)
+    if deadline is not None:
+        deadline = time.perf_counter() + (deadline - time.time())
+    try:
+        slots, unplaced = worker_solver.run(rng, deadline, worker_stop)
+    except GenerationCancelled:
+        return attempt, None
+    return attempt, slots
+
+def solve_parallel(solver, required, workers=None, attempts=None, time_budget=None, seed=0, cancel=None, progress=None):
+    # Each worker receives the solver (compact bitset rows) once through the
+    # pool initializer; tasks only carry an attempt number. The result is
+    # reproducible from the seed as long as every attempt finishes in time.
+    import multiprocessing
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    attempts = attempts or workers * 4
+    deadline = None if time_budget is None else time.time() + time_budget
+    results = []
+    # The pool is shut down without waiting, so a deadline or a cancel
+    # returns straight away: queued attempts are dropped and stop tells the
+    # running ones to give up.
+    context = multiprocessing.get_context()
+    stop = context.Event()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(solver, stop))
+    try:
+        futures = [pool.submit(run_attempt, attempt, seed, deadline) for attempt in range(attempts)]
+        done = set()
+        not_done = set(futures)
+        while not_done:
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            timeout = 0.1 if deadline is None else min(0.1, deadline - time.time())
+            if timeout <= 0:
+                break
+            finished, not_done = wait(not_done, timeout=timeout, return_when=FIRST_COMPLETED)
+            done |= finished
+            if progress is not None and finished:
+                progress(len(done), attempts)
+        if not_done:
+            # Past the deadline: drop queued attempts and collect the best-so-far
+            # timetables the running ones hand back.
+            for future in not_done:
+                future.cancel()
+            finished, not_done = wait(not_done, timeout=0.5)
+            done |= {future for future in finished if not future.cancelled()}
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    for future in done:
+        attempt, slots = future.result()
+        if slots is not None:
+            results.append((score_slots(solver.dataset, slots, required), attempt, slots))
+    if not results:
+        # No attempt came back at all, so fall back to one deterministic
+        # run in this process.
+        slots, unplaced = solver.run()
+        results.append((score_slots(solver.dataset, slots, required), 0, slots))
+    score, attempt, slots = min(results, key=lambda result: (result[0], result[1]))
+    return SolverResult(slots, score, len(results), time.perf_counter() - start)
+
+def solve_component(solver, time_budget, deadline, room_usage):
+    # deadline is wall-clock, as in run_attempt; a component that waited in
+    # the queue only gets whatever is left of it.
+    if deadline is not None:
+        time_budget = max(0.0, min(time_budget, deadline - time.time()))
+    try:
+        return solver.solve(time_budget, cancel=worker_stop, room_usage=room_usage).slots
+    except GenerationCancelled:
+        return None
+
+def reserve_rooms(dataset, components, num_slots):
+    # Splits each subject's rooms between the components that teach it, in
+    # proportion to their group counts. The rooms left over after rounding
+    # rotate between components from slot to slot. Returns, per component,
+    # the rooms per slot reserved for everyone else (DSaturSolver's
+    # room_usage).
+    weights = []
+    for component in components:
+        counts = {}
+        for group_id in component:
+            subjectid = dataset.subject_of(group_id)
+            counts[subjectid] = counts.get(subjectid, 0) + 1
+        weights.append(counts)
+    reserved = [[{} for _ in range(num_slots)] for _ in components]
+    for subjectid, rooms in dataset.available_classrooms.items():
+        users = [c for c, counts in enumerate(weights) if subjectid in counts]
+        total = sum(weights[c][subjectid] for c in users)
+        base = {c: rooms * weights[c][subjectid] // total for c in users}
+        extra = rooms - sum(base.values())
+        for s in range(num_slots):
+            for n, c in enumerate(users):
+                quota = base[c] + (1 if (n - s) % len(users) < extra else 0)
+                reserved[c][s][subjectid] = rooms - quota
+    return reserved
+
+def merge_components(dataset, matrix, num_slots, component_slots):
+    # Components never clash with each other, so their slots can simply be
+    # unioned; the only shared resource is classrooms. Lessons over a
+    # subject's room count are moved to another compatible slot with a free
+    # room, or dropped if there is none.
+    merged = [[] for _ in range(num_slots)]
+    for slots in component_slots:
+        for s, slot in enumerate(slots):
+            merged[s] += slot
+    usage = [{} for _ in range(num_slots)]
+    displaced = []
+    for s, slot in enumerate(merged):
+        kept = []
+        for group_id in slot:
+            subjectid = dataset.subject_of(group_id)
+            if usage[s].get(subjectid, 0) < dataset.available_classrooms.get(subjectid, 0):
+                usage[s][subjectid] = usage[s].get(subjectid, 0) + 1
+                kept.append(group_id)
+            else:
+                displaced.append(group_id)
+        merged[s] = kept
+    masks = [matrix.to_mask(slot) for slot in merged]
+    for group_id in displaced:
+        i = matrix.group_index[group_id]
+        subjectid = dataset.subject_of(group_id)
+        for s in range(num_slots):
+            if masks[s] & ((1 << i) | (matrix.all_mask & ~matrix.compatible[i])):
+                continue
+            if usage[s].get(subjectid, 0) >= dataset.available_classrooms.get(subjectid, 0):
+                continue
+            merged[s].append(group_id)
+            masks[s] |= 1 << i
+            usage[s][subjectid] = usage[s].get(subjectid, 0) + 1
+            break
+    return [sorted(slot, key=matrix.group_index.get) for slot in merged]
+
+def solve_components(dataset, matrix, num_slots, required, components, workers=None, time_budget=None, seed=0, progress=None, cancel=None):
+    # Each component gets a share of the time budget proportional to its
+    # size. Run in order, every component sees the rooms already taken by
+    # the ones before it; run in parallel, each works within its reserved
+    # share of rooms and merge_components fixes up anything left over.
+    start = time.perf_counter()
+    total_groups = sum(len(component) for component in components) or 1
+    solvers = [DSaturSolver(dataset, matrix, num_slots, required, seed, component) for component in components]
+    budgets = [None if time_budget is None else time_budget * len(component) / total_groups for component in components]
+
+    if workers is None or workers <= 1:
+        room_usage = [{} for _ in range(num_slots)]
+        slots = [[] for _ in range(num_slots)]
+        for n, (solver, budget) in enumerate(zip(solvers, budgets)):
+            result = solver.solve(budget, cancel=cancel, room_usage=room_usage)
+            for s, slot in enumerate(result.slots):
+                slots[s] += slot
+                for group_id in slot:
+                    subjectid = dataset.subject_of(group_id)
+                    room_usage[s][subjectid] = room_usage[s].get(subjectid, 0) + 1
+            if progress is not None:
+                progress(n + 1, len(solvers))
+        slots = [sorted(slot, key=matrix.group_index.get) for slot in slots]
+    else:
+        import multiprocessing
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+        reserved = reserve_rooms(dataset, components, num_slots)
+        deadline = None
+        if time_budget is not None:
+            # Components run side by side, so each can use a bigger share,
+            # but all of them stop at the one overall deadline.
+            budgets = [min(time_budget, budget * min(workers, len(components))) for budget in budgets]
+            deadline = time.time() + time_budget
+        # Shut down as in solve_parallel: queued components are dropped at
+        # the deadline or on cancel, and stop tells the running ones to give
+        # up; a component that never ran contributes no lessons.
+        context = multiprocessing.get_context()
+        stop = context.Event()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(None, stop))
+        try:
+            futures = [pool.submit(solve_component, solver, budget, deadline, usage) for solver, budget, usage in zip(solvers, budgets, reserved)]
+            not_done = set(futures)
+            while not_done:
+                if cancel is not None and cancel.is_set():
+                    raise GenerationCancelled()
+                timeout = 0.1 if deadline is None else min(0.1, deadline - time.time())
+                if timeout <= 0:
+                    break
+                finished, not_done = wait(not_done, timeout=timeout, return_when=FIRST_COMPLETED)
+                if progress is not None and finished:
+                    progress(len(futures) - len(not_done), len(futures))
+            if not_done:
+                # Past the deadline: running components hand back their
+                # best-so-far timetables.
+                for future in not_done:
+                    future.cancel()
+                wait(not_done, timeout=0.5)
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+        component_slots = []
+        for future in futures:
+            slots = future.result() if future.done() and not future.cancelled() else None
+            component_slots.append([[] for _ in range(num_slots)] if slots is None else slots)
+        slots = merge_components(dataset, matrix, num_slots, component_slots)
+
+    return SolverResult(slots, score_slots(dataset, slots, required), len(components), time.perf_counter() - start)
@@ -0,0 +1,107 @@
+import argparse
+import os
+import random
+import sqlite3
+import ddl
+
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Jamie", "Riley", "Charlie", "Robin",
+               "Ellis", "Harper", "Quinn", "Rowan", "Sasha", "Avery", "Drew", "Frankie", "Kai", "Nico"]
+LAST_NAMES = ["Smith", "Jones", "Taylor", "Brown", "Williams", "Wilson", "Johnson", "Davies", "Patel", "Wright",
+              "Robinson", "Thompson", "Evans", "Walker", "Khan", "Green", "Hughes", "Edwards", "Hall", "Wood"]
+
+def random_name(rng):
+    return rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+def generate_school(path, pupils=300, groups=60, teachers=25, rooms=25, subjects=10, days=5, periods=6, blocks=4, overlap=0.1, seed=0):
+    # Groups are split across option blocks and every pupil takes one group
+    # per block, so groups in the same block never share pupils. overlap is
+    # the chance that a pupil also joins one extra group anywhere, which is
+    # what creates clashes between blocks.
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    if rooms < subjects:
+        raise ValueError("Need at least one room per subject")
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    ddl.create_schema(conn)
+
+    conn.executemany("INSERT INTO Period (PeriodID, Day, PeriodNumber) VALUES (?, ?, ?)",
+                     [(day * periods + number, day, number) for day in range(days) for number in range(periods)])
+    conn.executemany("INSERT INTO Subject (SubjectID, SubjectName) VALUES (?, ?)",
+                     [(subjectid, f"Subject {subjectid}") for subjectid in range(subjects)])
+
+    teacher_subjects = {subjectid: [] for subjectid in range(subjects)}
+    teacher_rows = []
+    teacher_subject_rows = []
+    for teacherid in range(teachers):
+        first_name, last_name = random_name(rng)
+        teacher_rows.append((teacherid, first_name, last_name))
+        taught = {teacherid % subjects}
+        if rng.random() < 0.3:
+            taught.add(rng.randrange(subjects))
+        for subjectid in sorted(taught):
+            teacher_subjects[subjectid].append(teacherid)
+            teacher_subject_rows.append((teacherid, subjectid))
+    for subjectid, staff in teacher_subjects.items():
+        if not staff:
+            teacherid = rng.randrange(teachers)
+            staff.append(teacherid)
+            teacher_subject_rows.append((teacherid, subjectid))
+    conn.executemany("INSERT INTO Teacher (TeacherID, FirstName, LastName) VALUES (?, ?, ?)", teacher_rows)
+    conn.executemany("INSERT INTO TeacherSubject (TeacherID, SubjectID) VALUES (?, ?)", teacher_subject_rows)
+
+    block_groups = [[] for _ in range(blocks)]
+    block_teachers = [set() for _ in range(blocks)]
+    group_rows = []
+    subject_group_counts = [0] * subjects
+    for groupid in range(groups):
+        block = groupid % blocks
+        subjectid = (groupid // blocks + block) % subjects
+        staff = teacher_subjects[subjectid]
+        free = [teacherid for teacherid in staff if teacherid not in block_teachers[block]]
+        teacherid = rng.choice(free or staff)
+        block_teachers[block].add(teacherid)
+        block_groups[block].append(groupid)
+        subject_group_counts[subjectid] += 1
+        group_rows.append((groupid, teacherid, subjectid))
+    conn.executemany("INSERT INTO [Group] (GroupID, TeacherID, SubjectID) VALUES (?, ?, ?)", group_rows)
+
+    room_subjects = list(range(subjects))
+    weights = [count or 1 for count in subject_group_counts]
+    room_subjects += rng.choices(range(subjects), weights=weights, k=rooms - subjects)
+    conn.executemany("INSERT INTO Classroom (ClassroomID, SubjectID) VALUES (?, ?)", list(enumerate(room_subjects)))
+
+    pupil_rows = []
+    membership_rows = []
+    for pupilid in range(pupils):
+        first_name, last_name = random_name(rng)
+        pupil_rows.append((pupilid, first_name, last_name, 12 + pupilid % 2))
+        chosen = {rng.choice(members) for members in block_groups if members}
+        if rng.random() < overlap:
+            chosen.add(rng.randrange(groups))
+        membership_rows += [(groupid, pupilid) for groupid in sorted(chosen)]
+    conn.executemany("INSERT INTO Pupil (PupilID, FirstName, LastName, YearGroup) VALUES (?, ?, ?, ?)", pupil_rows)
+    conn.executemany("INSERT INTO PupilGroup (GroupID, PupilID) VALUES (?, ?)", membership_rows)
+
+    conn.commit()
+    conn.close()
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic school database")
+    parser.add_argument("path")
+    parser.add_argument("--pupils", type=int, default=300)
+    parser.add_argument("--groups", type=int, default=60)
+    parser.add_argument("--teachers", type=int, default=25)
+    parser.add_argument("--rooms", type=int, default=25)
+    parser.add_argument("--subjects", type=int, default=10)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--periods", type=int, default=6)
+    parser.add_argument("--blocks", type=int, default=4)
+    parser.add_argument("--overlap", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_school(args.path, args.pupils, args.groups, args.teachers, args.rooms, args.subjects, args.days, args.periods, args.blocks, args.overlap, args.seed)
+
+if __name__ == "__main__":
+    main()
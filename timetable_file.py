@@ -0,0 +1,122 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# Layout: header, then int32 sections in this order:
+#   lessons          n_lessons * (PeriodID, GroupID, ClassroomID, SubjectID)
+#   pupil ids        sorted, n_pupils
+#   pupil offsets    n_pupils + 1, into pupil lessons
+#   pupil lessons    lesson numbers, each person's sorted by period
+#   teacher ids / teacher offsets / teacher lessons, as for pupils
+# ClassroomID is -1 where the lesson has no room.
+MAGIC = b"TTBL"
+VERSION = 1
+HEADER = struct.Struct("<4sIB3xIIIII")
+LESSON_FIELDS = ("PeriodID", "GroupID", "ClassroomID", "SubjectID")
+NO_ROOM = -1
+
+def build_index(lesson_owners):
+    person_ids = sorted(lesson_owners)
+    offsets = array("i", [0])
+    lessons = array("i")
+    for person_id in person_ids:
+        lessons.extend(lesson_owners[person_id])
+        offsets.append(len(lessons))
+    return array("i", person_ids), offsets, lessons
+
+def compile_timetable(db_manager, path):
+    query = "SELECT PeriodID, Schedule.GroupID, ClassroomID, 'Group'.SubjectID, 'Group'.TeacherID FROM Schedule JOIN 'Group' ON 'Group'.GroupID = Schedule.GroupID ORDER BY PeriodID, Schedule.GroupID"
+    lessons = array("i")
+    group_lessons = {}
+    teacher_lessons = {}
+    for n, (periodid, groupid, classroomid, subjectid, teacherid) in enumerate(db_manager.execute_query(query)):
+        lessons.extend((periodid, groupid, NO_ROOM if classroomid is None else classroomid, subjectid))
+        group_lessons.setdefault(groupid, []).append(n)
+        if teacherid is not None:
+            teacher_lessons.setdefault(teacherid, []).append(n)
+
+    pupil_lessons = {}
+    for groupid, pupilid in db_manager.execute_query("SELECT GroupID, PupilID FROM PupilGroup"):
+        pupil_lessons.setdefault(pupilid, []).extend(group_lessons.get(groupid, ()))
+    for refs in pupil_lessons.values():
+        refs.sort()
+
+    pupils = build_index(pupil_lessons)
+    teachers = build_index(teacher_lessons)
+    byteorder = 0 if sys.byteorder == "little" else 1
+    header = HEADER.pack(MAGIC, VERSION, byteorder, len(lessons) // 4, len(pupils[0]), len(pupils[2]), len(teachers[0]), len(teachers[2]))
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as output:
+        output.write(header)
+        for section in (lessons,) + pupils + teachers:
+            section.tofile(output)
+    os.replace(temp_path, path)
+    return {"path": path, "lessons": len(lessons) // 4, "pupils": len(pupils[0]), "teachers": len(teachers[0])}
+
+class TimetableFile:
+    # Read-only view of a compiled timetable. Sections are int32 memoryviews
+    # straight over the mmap, so a lookup is two binary searches and a slice
+    # with no copying and no SQLite.
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, byteorder, n_lessons, n_pupils, n_pupil_refs, n_teachers, n_teacher_refs = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a compiled timetable")
+        if byteorder != (0 if sys.byteorder == "little" else 1):
+            self.close()
+            raise ValueError(f"{path} was compiled on a machine with a different byte order")
+
+        self.view = memoryview(self.map)
+        self.sections = []
+        position = HEADER.size
+        for count in (n_lessons * 4, n_pupils, n_pupils + 1, n_pupil_refs, n_teachers, n_teachers + 1, n_teacher_refs):
+            self.sections.append(self.view[position:position + count * 4].cast("i"))
+            position += count * 4
+        self.lessons = self.sections[0]
+        self.pupils = tuple(self.sections[1:4])
+        self.teachers = tuple(self.sections[4:7])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for section in getattr(self, "sections", ()):
+            section.release()
+        self.sections = []
+        if getattr(self, "view", None) is not None:
+            self.view.release()
+            self.view = None
+        self.map.close()
+        self.file.close()
+
+    def lesson_numbers(self, index, person_id):
+        # Returns a list rather than a slice of the mmap, so a caller holding
+        # on to it never stops close() from unmapping the file.
+        person_ids, offsets, refs = index
+        i = bisect.bisect_left(person_ids, person_id)
+        if i == len(person_ids) or person_ids[i] != person_id:
+            return []
+        with refs[offsets[i]:offsets[i + 1]] as numbers:
+            return numbers.tolist()
+
+    def week(self, index, person_id):
+        week = []
+        for n in self.lesson_numbers(index, person_id):
+            periodid, groupid, classroomid, subjectid = self.lessons[n * 4:n * 4 + 4]
+            week.append({"PeriodID": periodid, "GroupID": groupid, "ClassroomID": None if classroomid == NO_ROOM else classroomid, "SubjectID": subjectid})
+        return week
+
+    def pupil_week(self, pupil_id):
+        return self.week(self.pupils, pupil_id)
+
+    def teacher_week(self, teacher_id):
+        return self.week(self.teachers, teacher_id)
@@ -1,11 +1,187 @@
+import bisect
+import heapq
+import re
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import ddl
+from matching import hopcroft_karp
+from solver import DSaturSolver, GenerationCancelled, iter_bits, SolverResult, score_slots, solve_components, solve_parallel
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+class NameIndex:
+    # Sorted (lower-cased full name, full name, id) entries for one table,
+    # giving O(log n) exact lookups and prefix completion. People who share a
+    # name are shown as "First Last (ID)" so each one can be picked.
+    def __init__(self, rows):
+        self.entries = sorted((f"{first} {last}".lower(), f"{first} {last}", person_id) for person_id, first, last in rows)
+        self.keys = [entry[0] for entry in self.entries]
+        self.records = {person_id: (first, last) for person_id, first, last in rows}
+        counts = {}
+        for _, full_name, _ in self.entries:
+            counts[full_name] = counts.get(full_name, 0) + 1
+        self.duplicates = {full_name for full_name, count in counts.items() if count > 1}
+
+    def display_name(self, full_name, person_id):
+        if full_name in self.duplicates:
+            return f"{full_name} ({person_id})"
+        return full_name
+
+    def names(self):
+        return [self.display_name(full_name, person_id) for _, full_name, person_id in self.entries]
+
+    def lookup(self, full_name):
+        key = full_name.lower()
+        start = bisect.bisect_left(self.keys, key)
+        end = bisect.bisect_right(self.keys, key)
+        return [person_id for _, name, person_id in self.entries[start:end] if name == full_name]
+
+    def resolve(self, display_name):
+        ids = self.lookup(display_name)
+        if ids:
+            return ids
+        match = re.fullmatch(r"(.*) \((.+)\)", display_name)
+        if match:
+            for person_id in self.lookup(match.group(1)):
+                if str(person_id) == match.group(2):
+                    return [person_id]
+        return []
+
+    def complete(self, prefix, limit=None):
+        # The search starts from the part before any " (ID)" so a prefix that
+        # runs into a shared name's ID still finds it.
+        key = prefix.lower()
+        stem = key.partition(" (")[0].rstrip(" ")
+        names = []
+        for i in range(bisect.bisect_left(self.keys, stem), len(self.entries)):
+            lower_name, full_name, person_id = self.entries[i]
+            if not lower_name.startswith(stem) or (limit is not None and len(names) >= limit):
+                break
+            display_name = self.display_name(full_name, person_id)
+            if display_name.lower().startswith(key):
+                names.append(display_name)
+        return names
+
+    def record(self, person_id):
+        return self.records[person_id]
 
 class DatabaseManager:
-    def __init__(self, db_file):
+    # With persistent=True each thread keeps one long-lived connection (so the
+    # GUI and worker threads never share a handle) and sqlite3's statement
+    # cache is reused between calls; otherwise every call opens its own
+    # connection as before.
+    def __init__(self, db_file, persistent=False, pragmas=None, cached_statements=256, profiler=None):
         self.db_file = db_file
+        self.persistent = persistent
+        if pragmas is None:
+            pragmas = DEFAULT_PRAGMAS if persistent else {}
+        self.pragmas = dict(pragmas)
+        self.cached_statements = cached_statements
+        self.profiler = profiler
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.name_indexes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open_connection(self):
+        conn = sqlite3.connect(self.db_file, cached_statements=self.cached_statements, check_same_thread=not self.persistent)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.profiler is not None:
+            return self.profiler.on_connect(conn)
+        return conn
 
     def connect(self):
-        return sqlite3.connect(self.db_file)
+        if not self.persistent:
+            return self.open_connection()
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.open_connection()
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            if not self.persistent:
+                conn.close()
+
+    def backup(self, target_path, pages=256, progress=None):
+        # Online copy through SQLite's backup API: it reads a consistent
+        # snapshot (WAL included) a few pages at a time, and the old backup
+        # is only replaced once the new one is complete.
+        temp_path = target_path + ".tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        def report(status, remaining, total):
+            if progress is not None:
+                progress(total - remaining, total)
+
+        source = self.connect()
+        target = sqlite3.connect(temp_path)
+        completed = False
+        try:
+            source.backup(target, pages=pages, progress=report)
+            completed = True
+        finally:
+            target.close()
+            if not self.persistent:
+                source.close()
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+        os.replace(temp_path, target_path)
+        return target_path
+
+    def snapshot_schedule(self, table="ScheduleSnapshot"):
+        with self.transaction() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"CREATE TABLE {table} AS SELECT PeriodID, GroupID, ClassroomID FROM Schedule")
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def restore_schedule_snapshot(self, table="ScheduleSnapshot"):
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is None:
+                raise ValueError(f"No schedule snapshot in {self.db_file}")
+            conn.execute("DELETE FROM Schedule")
+            conn.execute(f"INSERT INTO Schedule (PeriodID, GroupID, ClassroomID) SELECT PeriodID, GroupID, ClassroomID FROM {table}")
+            return conn.execute("SELECT COUNT(*) FROM Schedule").fetchone()[0]
+
+    def migrate(self):
+        conn = self.connect()
+        try:
+            return ddl.migrate(conn)
+        finally:
+            if not self.persistent:
+                conn.close()
 
     def get_num_groups(self):
         with self.connect() as conn:
@@ -22,99 +198,260 @@ class DatabaseManager:
                 cursor.execute(query)
             return cursor.fetchall()
     
+    def database_stamp(self):
+        # Any committed write changes the size or mtime of the database or
+        # its WAL file, which is what invalidates the cached name indexes.
+        stamp = []
+        for path in (self.db_file, self.db_file + "-wal"):
+            try:
+                status = os.stat(path)
+                stamp.append((status.st_mtime_ns, status.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def get_name_index(self, category):
+        if category not in ("Pupil", "Teacher"):
+            raise ValueError(f"Unknown category {category!r}")
+        stamp = self.database_stamp()
+        cached = self.name_indexes.get(category)
+        if cached is None or cached[0] != stamp:
+            rows = self.execute_query(f"SELECT {category}ID, FirstName, LastName FROM {category}")
+            cached = (stamp, NameIndex(rows))
+            self.name_indexes[category] = cached
+        return cached[1]
+
     def get_pupil_names(self):
-        with self.connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT FirstName, LastName FROM Pupil")
-            return [f"{row[0]} {row[1]}" for row in cursor.fetchall()]
+        return self.get_name_index("Pupil").names()
 
     def get_teacher_names(self):
+        return self.get_name_index("Teacher").names()
+
+    def get_schedule_by_ids(self, query, ids):
         with self.connect() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT FirstName, LastName FROM Teacher")
-            return [f"{row[0]} {row[1]}" for row in cursor.fetchall()]
-        
-    def get_pupil_schedule(self, pupil_name):
-        with self.connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT PeriodID, 'Group'.GroupID, ClassroomID, 'Group'.SubjectID FROM Schedule JOIN PupilGroup ON Schedule.GroupID = PupilGroup.GroupID JOIN Pupil ON PupilGroup.PupilID = Pupil.PupilID JOIN 'Group' ON PupilGroup.GroupID = 'Group'.GroupID WHERE Pupil.FirstName || ' ' || Pupil.LastName = ?", (pupil_name,))
+            cursor.execute(query.format(", ".join("?" * len(ids))), ids)
             rows = cursor.fetchall()
             column_names = [description[0] for description in cursor.description]
             return [dict(zip(column_names, row)) for row in rows]
 
+    def get_pupil_schedule(self, pupil_name):
+        return self.get_schedule_by_ids(ddl.PUPIL_SCHEDULE_QUERY, [self.get_pupil_id(pupil_name)])
+
     def get_teacher_schedule(self, teacher_name):
-        with self.connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT PeriodID, 'Group'.GroupID, ClassroomID, 'Group'.SubjectID FROM Schedule JOIN 'Group' ON Schedule.GroupID = 'Group'.GroupID JOIN Teacher ON 'Group'.TeacherID = Teacher.TeacherID WHERE Teacher.FirstName || ' ' || Teacher.LastName = ?", (teacher_name,))
-            rows = cursor.fetchall()
-            column_names = [description[0] for description in cursor.description]
-            return [dict(zip(column_names, row)) for row in rows]
-        
+        return self.get_schedule_by_ids(ddl.TEACHER_SCHEDULE_QUERY, [self.get_teacher_id(teacher_name)])
+
+    def count_people(self, category):
+        if category not in ("Pupil", "Teacher"):
+            raise ValueError(f"Unknown category {category!r}")
+        return self.execute_query(f"SELECT COUNT(*) FROM {category}")[0][0]
+
+    def iter_all_schedules(self, category):
+        if category == "Pupil":
+            query = "SELECT Pupil.PupilID, Pupil.FirstName, Pupil.LastName, PeriodID, 'Group'.GroupID, ClassroomID, 'Group'.SubjectID FROM Pupil JOIN PupilGroup ON PupilGroup.PupilID = Pupil.PupilID JOIN Schedule ON Schedule.GroupID = PupilGroup.GroupID JOIN 'Group' ON 'Group'.GroupID = PupilGroup.GroupID ORDER BY Pupil.PupilID, PeriodID"
+        elif category == "Teacher":
+            query = "SELECT Teacher.TeacherID, Teacher.FirstName, Teacher.LastName, PeriodID, 'Group'.GroupID, ClassroomID, 'Group'.SubjectID FROM Teacher JOIN 'Group' ON 'Group'.TeacherID = Teacher.TeacherID JOIN Schedule ON Schedule.GroupID = 'Group'.GroupID ORDER BY Teacher.TeacherID, PeriodID"
+        else:
+            raise ValueError(f"Unknown category {category!r}")
+        conn = self.connect()
+        try:
+            yield from conn.execute(query)
+        finally:
+            if not self.persistent:
+                conn.close()
+
+    def get_person_id(self, category, full_name):
+        ids = self.get_name_index(category).resolve(full_name)
+        if not ids:
+            raise ValueError(f"No {category.lower()} called {full_name!r}")
+        if len(ids) > 1:
+            raise ValueError(f"{len(ids)} {category.lower()}s are called {full_name!r}, pick one from the list")
+        return ids[0]
+
     def get_pupil_id(self, full_name):
-        with self.connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT PupilID FROM Pupil WHERE FirstName || ' ' || LastName = ?", (full_name,))
-            result = cursor.fetchone()
-            return result[0]
+        return self.get_person_id("Pupil", full_name)
 
     def get_teacher_id(self, full_name):
-        with self.connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT TeacherID FROM Teacher WHERE FirstName || ' ' || LastName = ?", (full_name,))
-            result = cursor.fetchone()
-            return result[0]
+        return self.get_person_id("Teacher", full_name)
+
+class SchoolDataset:
+    # Read-only snapshot of the static school data, loaded with a handful of
+    # bulk SELECTs. Per-group tables are tuples indexed by position in
+    # group_ids; use group_index to go from a GroupID to that position.
+    def __init__(self, group_ids, group_teachers, group_subjects, group_pupils, subject_classrooms, periods_per_day, num_days):
+        self.group_ids = tuple(group_ids)
+        self.group_index = {group_id: i for i, group_id in enumerate(self.group_ids)}
+        self.num_groups = len(self.group_ids)
+        self.group_teachers = tuple(group_teachers)
+        self.group_subjects = tuple(group_subjects)
+        self.group_pupils = tuple(tuple(pupils) for pupils in group_pupils)
+        self.subject_classrooms = {subjectid: tuple(classrooms) for subjectid, classrooms in subject_classrooms.items()}
+        self.available_classrooms = {subjectid: len(classrooms) for subjectid, classrooms in self.subject_classrooms.items()}
+        subject_groups = {}
+        for group_id, subjectid in zip(self.group_ids, self.group_subjects):
+            subject_groups.setdefault(subjectid, []).append(group_id)
+        self.subject_groups = {subjectid: tuple(groups) for subjectid, groups in subject_groups.items()}
+        self.periods_per_day = periods_per_day
+        self.num_days = num_days
+        self.num_slots = (periods_per_day + 1) * (num_days + 1)
+
+    @classmethod
+    def load(cls, db_manager):
+        groups = db_manager.execute_query("SELECT GroupID, TeacherID, SubjectID FROM 'Group' ORDER BY GroupID")
+        group_ids = [row[0] for row in groups]
+        members = {group_id: [] for group_id in group_ids}
+        for group_id, pupil_id in db_manager.execute_query("SELECT GroupID, PupilID FROM PupilGroup"):
+            if group_id in members:
+                members[group_id].append(pupil_id)
+        subject_classrooms = {}
+        for subjectid, classroomid in db_manager.execute_query("SELECT SubjectID, ClassroomID FROM Classroom ORDER BY rowid"):
+            subject_classrooms.setdefault(subjectid, []).append(classroomid)
+        periods_per_day, num_days = db_manager.execute_query("SELECT MAX(PeriodNumber), MAX(Day) FROM Period")[0]
+        return cls(group_ids, [row[1] for row in groups], [row[2] for row in groups], [members[group_id] for group_id in group_ids], subject_classrooms, periods_per_day, num_days)
+
+    def teacher_of(self, group_id):
+        return self.group_teachers[self.group_index[group_id]]
+
+    def subject_of(self, group_id):
+        return self.group_subjects[self.group_index[group_id]]
+
+    def pupils_of(self, group_id):
+        return self.group_pupils[self.group_index[group_id]]
+
+    def classrooms_for(self, group_id):
+        return self.subject_classrooms.get(self.subject_of(group_id), ())
+
+def bits_to_ids(mask, group_ids):
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(group_ids[low.bit_length() - 1])
+        mask ^= low
+    return ids
+
+class CompatibilityMatrix:
+    # Row i of each matrix is a bitset over group indices; bit j is set when
+    # group_ids[i] and group_ids[j] share a pupil (or a teacher).
+    def __init__(self, group_ids, group_teachers, group_pupils):
+        self.group_ids = list(group_ids)
+        self.group_index = {group_id: i for i, group_id in enumerate(self.group_ids)}
+        self.num_groups = len(self.group_ids)
+        self.all_mask = (1 << self.num_groups) - 1
+
+        pupil_groups = {}
+        for i, pupils in enumerate(group_pupils):
+            bit = 1 << i
+            for pupil_id in pupils:
+                pupil_groups[pupil_id] = pupil_groups.get(pupil_id, 0) | bit
+
+        self.pupil_clash = []
+        for pupils in group_pupils:
+            row = 0
+            for pupil_id in pupils:
+                row |= pupil_groups[pupil_id]
+            self.pupil_clash.append(row)
+
+        teacher_groups = {}
+        for i, teacher_id in enumerate(group_teachers):
+            if teacher_id is not None:
+                teacher_groups[teacher_id] = teacher_groups.get(teacher_id, 0) | (1 << i)
+        taught_mask = 0
+        for mask in teacher_groups.values():
+            taught_mask |= mask
+
+        # A group with no teacher matches nothing in "TeacherID != ?", so it
+        # clashes with every group, and every other group clashes with it.
+        self.teacher_clash = []
+        for teacher_id in group_teachers:
+            if teacher_id is None:
+                self.teacher_clash.append(self.all_mask)
+            else:
+                self.teacher_clash.append(teacher_groups[teacher_id] | (self.all_mask & ~taught_mask))
+
+        self.compatible = [self.all_mask & ~(self.pupil_clash[i] | self.teacher_clash[i]) for i in range(self.num_groups)]
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        return cls(dataset.group_ids, dataset.group_teachers, dataset.group_pupils)
+
+    @classmethod
+    def from_database(cls, db_manager):
+        return cls.from_dataset(SchoolDataset.load(db_manager))
+
+    def pupil_compatible_ids(self, group_id):
+        i = self.group_index[group_id]
+        return bits_to_ids(self.all_mask & ~self.pupil_clash[i], self.group_ids)
+
+    def teacher_compatible_ids(self, group_id):
+        i = self.group_index[group_id]
+        return bits_to_ids(self.all_mask & ~self.teacher_clash[i], self.group_ids)
+
+    def compatible_ids(self, group_id):
+        return bits_to_ids(self.compatible[self.group_index[group_id]], self.group_ids)
+
+    def components(self):
+        # Connected components of the clash graph, largest first. Groups in
+        # different components share no pupils or teachers, even indirectly.
+        unseen = self.all_mask
+        components = []
+        while unseen:
+            frontier = unseen & -unseen
+            component = 0
+            while frontier:
+                component |= frontier
+                reached = 0
+                for i in iter_bits(frontier):
+                    reached |= self.all_mask & ~self.compatible[i]
+                frontier = reached & ~component
+            unseen &= ~component
+            components.append(bits_to_ids(component, self.group_ids))
+        components.sort(key=len, reverse=True)
+        return components
+
+    def to_mask(self, group_ids):
+        mask = 0
+        for group_id in group_ids:
+            mask |= 1 << self.group_index[group_id]
+        return mask
 
 class GroupCompatibilityManager:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, dataset=None):
         self.db_manager = db_manager
-    
+        self.dataset = dataset
+        self.matrix = None
+
+    def get_dataset(self):
+        if self.dataset is None:
+            self.dataset = SchoolDataset.load(self.db_manager)
+        return self.dataset
+
+    def get_matrix(self):
+        if self.matrix is None:
+            self.matrix = CompatibilityMatrix.from_dataset(self.get_dataset())
+        return self.matrix
+
     def get_compatible_groups_by_pupil_id(self):
-        num_groups = self.db_manager.get_num_groups()
-        compatible_groups = {}
-        for group_id in range(num_groups):
-            query = "SELECT PupilID FROM PupilGroup WHERE GroupID = ?"
-            pupil_ids = self.db_manager.execute_query(query, (group_id,))
-            pupils = set([pupil_id[0] for pupil_id in pupil_ids])
-            temp_compat = []
-            for compare_group in range(num_groups):
-                query = "SELECT PupilID FROM PupilGroup WHERE GroupID = ?"
-                compare_ids = self.db_manager.execute_query(query, (compare_group,))
-                compare_pupils = set([pupil_id[0] for pupil_id in compare_ids])
-                if pupils.isdisjoint(compare_pupils):
-                    temp_compat.append(compare_group)
-            compatible_groups[group_id] = temp_compat
-        return compatible_groups
+        matrix = self.get_matrix()
+        return {group_id: matrix.pupil_compatible_ids(group_id) for group_id in matrix.group_ids}
 
     def get_compatible_groups_by_teacher_id(self):
-        num_groups = self.db_manager.get_num_groups()
-        compatible_groups = {}
-        for group_id in range(num_groups):
-            query = "SELECT TeacherID FROM 'Group' WHERE GroupID = ?"
-            teacher_id = self.db_manager.execute_query(query, (group_id,))[0][0]
-            query = "SELECT GroupID FROM 'Group' WHERE TeacherID != ?"
-            group_ids = self.db_manager.execute_query(query, (teacher_id,))
-            compatible_groups[group_id] = [group_id[0] for group_id in group_ids]
-        return compatible_groups
-    
+        matrix = self.get_matrix()
+        return {group_id: matrix.teacher_compatible_ids(group_id) for group_id in matrix.group_ids}
+
     def get_compatible_groups(self):
-        num_groups = self.db_manager.get_num_groups()
-        dict_pupil = self.get_compatible_groups_by_pupil_id()
-        dict_teacher = self.get_compatible_groups_by_teacher_id()
+        matrix = self.get_matrix()
         compatible_groups = {}
-        for group_id in range(num_groups):
-            compatible_pupils = set(dict_pupil[group_id])
-            compatible_teachers = set(dict_teacher[group_id])
+        for group_id in matrix.group_ids:
+            # Built the same way as before so the list order (which the greedy
+            # search depends on) is unchanged.
+            compatible_pupils = set(matrix.pupil_compatible_ids(group_id))
+            compatible_teachers = set(matrix.teacher_compatible_ids(group_id))
             compatible_groups[group_id] = list(set(compatible_pupils) & set(compatible_teachers))
-        
         return compatible_groups
     
     def get_group_subjects(self, groupids):
-        subject_ids = []
-        for groupid in groupids:
-            query = "SELECT SubjectID FROM 'Group' WHERE GroupID = ?"
-            subject_id = self.db_manager.execute_query(query, (groupid,))[0][0]
-            subject_ids.append(subject_id)
-        return subject_ids
+        dataset = self.get_dataset()
+        return [dataset.subject_of(groupid) for groupid in groupids]
     
     def count_subjects(self, groupids):
         subjects = self.get_group_subjects(groupids)
@@ -127,18 +464,10 @@ class GroupCompatibilityManager:
         return counts
 
     def get_available_classrooms_by_subject(self):
-        available_classrooms = {}
-        query = "SELECT SubjectID, COUNT(*) FROM Classroom GROUP BY SubjectID"
-        results = self.db_manager.execute_query(query)
-        for row in results:
-            subjectid, count = row
-            available_classrooms[subjectid] = count
-        return available_classrooms
+        return dict(self.get_dataset().available_classrooms)
     
     def get_groups_by_subject(self, subjectid):
-        query = "SELECT GroupID FROM 'Group' WHERE SubjectID = ?"
-        groups = self.db_manager.execute_query(query, (subjectid,))[0]
-        return groups
+        return list(self.get_dataset().subject_groups.get(subjectid, ()))
 
     def find_compatible_groupings(self, groupids, excluded_groupids, compatible_groups, available_classrooms):
         current_id = groupids[-1]
@@ -152,67 +481,311 @@ class GroupCompatibilityManager:
 
         return groupids
     
+class PlacementCounter:
+    # Bucket queue of groups keyed by how many lessons they have been placed
+    # in. Each bucket keeps a lazy min-heap of group positions so "first group
+    # with the fewest placements" matches the order of SchoolDataset.group_ids.
+    def __init__(self, group_ids):
+        self.group_ids = tuple(group_ids)
+        self.group_index = {group_id: i for i, group_id in enumerate(self.group_ids)}
+        self.counts = [0] * len(self.group_ids)
+        self.buckets = {0: set(range(len(self.group_ids)))}
+        self.heaps = {0: list(range(len(self.group_ids)))}
+        self.min_count = 0
+        self.max_count = 0
+
+    def move(self, i, step):
+        old = self.counts[i]
+        new = old + step
+        if new < 0:
+            raise ValueError(f"Group {self.group_ids[i]} has no placements to remove")
+        self.counts[i] = new
+        bucket = self.buckets[old]
+        bucket.discard(i)
+        if not bucket:
+            del self.buckets[old]
+            del self.heaps[old]
+        if new in self.buckets:
+            self.buckets[new].add(i)
+            heapq.heappush(self.heaps[new], i)
+        else:
+            self.buckets[new] = {i}
+            self.heaps[new] = [i]
+        if new < self.min_count or old == self.min_count and old not in self.buckets:
+            self.min_count = new
+        if new > self.max_count or old == self.max_count and old not in self.buckets:
+            self.max_count = new
+
+    def increment(self, group_id):
+        self.move(self.group_index[group_id], 1)
+
+    def decrement(self, group_id):
+        self.move(self.group_index[group_id], -1)
+
+    def count(self, group_id):
+        return self.counts[self.group_index[group_id]]
+
+    def as_dict(self):
+        return dict(zip(self.group_ids, self.counts))
+
+    def minimum(self):
+        heap = self.heaps[self.min_count]
+        bucket = self.buckets[self.min_count]
+        while heap[0] not in bucket:
+            heapq.heappop(heap)
+        return self.group_ids[heap[0]]
+
+    def most_placed(self, limit):
+        return [self.group_ids[i] for i in heapq.nsmallest(limit, self.buckets[self.max_count])]
+
+SOLVERS = ("greedy", "dsatur", "parallel", "components")
+
 class ScheduleManager:
 
-    def __init__(self, db_file):
-        self.db_manager = DatabaseManager(db_file)
-        self.compat_manager = GroupCompatibilityManager(self.db_manager)
-        query = "SELECT MAX(PeriodNumber), MAX(Day) FROM Period"
-        periods_per_day, num_days = self.db_manager.execute_query(query)[0]
-        self.slots = [[] for _ in range((periods_per_day + 1) * (num_days + 1))]
+    def __init__(self, db_file, persistent=True, pragmas=None, solver="greedy", lessons_per_group=None, profiler=None):
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver {solver!r}, expected one of {SOLVERS}")
+        self.profiler = profiler
+        self.db_manager = DatabaseManager(db_file, persistent=persistent, pragmas=pragmas, profiler=profiler)
+        with self.phase("migrate"):
+            self.db_manager.migrate()
+        with self.phase("load_dataset"):
+            self.dataset = SchoolDataset.load(self.db_manager)
+        self.compat_manager = GroupCompatibilityManager(self.db_manager, self.dataset)
+        self.slots = [[] for _ in range(self.dataset.num_slots)]
+        self.counter = PlacementCounter(self.dataset.group_ids)
+        self.slot_rooms = [{} for _ in range(self.dataset.num_slots)]
+        self.unmatched_slots = {}
+        self.solver = solver
+        self.required = self.get_required_lessons(lessons_per_group)
+        self.last_result = None
 
-    def get_counts(self):
-        num_groups = self.db_manager.get_num_groups()
-        counts = {groupid: 0 for groupid in range(num_groups)}
+    def close(self):
+        self.db_manager.close()
+
+    def phase(self, name):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name)
+
+    def get_required_lessons(self, lessons_per_group=None):
+        # Without an explicit figure every group is taught once a day.
+        if lessons_per_group is None:
+            lessons_per_group = self.dataset.num_days + 1
+        if isinstance(lessons_per_group, dict):
+            return {groupid: lessons_per_group.get(groupid, 0) for groupid in self.dataset.group_ids}
+        return {groupid: lessons_per_group for groupid in self.dataset.group_ids}
+
+    def reset_counter(self):
+        self.counter = PlacementCounter(self.dataset.group_ids)
         for slot in self.slots:
             for groupid in slot:
-                counts[groupid] += 1
-        return counts
+                self.counter.increment(groupid)
+
+    def set_slot(self, i, groupids):
+        for groupid in self.slots[i]:
+            self.counter.decrement(groupid)
+        self.slots[i] = groupids
+        for groupid in groupids:
+            self.counter.increment(groupid)
+
+    def get_counts(self):
+        return self.counter.as_dict()
 
     def get_minimum_count(self):
-        counts = self.get_counts()
-        minimum_count = min(counts, key=counts.get)
-        return minimum_count
+        return self.counter.minimum()
 
     def get_max_counts(self):
-        counts = self.get_counts()
-        max_count = max(counts.values())
-        top_x = int(self.db_manager.get_num_groups() * 0.8)
-        max_counts = [k for k in counts if counts[k] == max_count][:top_x]
-        return max_counts
+        top_x = int(self.dataset.num_groups * 0.8)
+        return self.counter.most_placed(top_x)
     
-    def assign_slots(self):
+    def assign_slots(self, solver=None, time_budget=None, seed=0, jobs=None, attempts=None, progress=None, cancel=None):
+        # progress(done, total) is called as work completes; setting the
+        # cancel event raises GenerationCancelled before anything is saved.
+        solver = solver or self.solver
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver {solver!r}, expected one of {SOLVERS}")
+        with self.phase("compatibility"):
+            self.compat_manager.get_matrix()
+        with self.phase(f"assign_slots ({solver})"):
+            if solver == "greedy":
+                result = self.assign_slots_greedy(progress, cancel)
+            elif solver == "dsatur":
+                result = self.assign_slots_dsatur(time_budget, seed, progress, cancel)
+            elif solver == "components":
+                result = self.assign_slots_components(jobs, time_budget, seed, progress, cancel)
+            else:
+                result = self.assign_slots_parallel(jobs, attempts, time_budget, seed, progress, cancel)
+        self.last_result = result
+        return result
+
+    def assign_slots_greedy(self, progress=None, cancel=None):
+        start = time.perf_counter()
         compatible_groups = self.compat_manager.get_compatible_groups()
         available_classrooms = self.compat_manager.get_available_classrooms_by_subject()
+        self.reset_counter()
         for i in range(len(self.slots)):
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
             group_min = self.get_minimum_count()
             excluded_groupids = self.get_max_counts()
-            self.slots[i] = self.compat_manager.find_compatible_groupings([group_min], excluded_groupids, compatible_groups, available_classrooms)
+            self.set_slot(i, self.compat_manager.find_compatible_groupings([group_min], excluded_groupids, compatible_groups, available_classrooms))
+            if progress is not None:
+                progress(i + 1, len(self.slots))
+        return SolverResult(self.slots, score_slots(self.dataset, self.slots, self.required), 1, time.perf_counter() - start)
+
+    def assign_slots_dsatur(self, time_budget=None, seed=0, progress=None, cancel=None):
+        solver = DSaturSolver(self.dataset, self.compat_manager.get_matrix(), len(self.slots), self.required, seed)
+        result = solver.solve(time_budget, cancel=cancel, progress=progress)
+        for i, slot in enumerate(result.slots):
+            self.set_slot(i, slot)
+        return result
+
+    def assign_slots_parallel(self, jobs=None, attempts=None, time_budget=None, seed=0, progress=None, cancel=None):
+        solver = DSaturSolver(self.dataset, self.compat_manager.get_matrix(), len(self.slots), self.required, seed)
+        result = solve_parallel(solver, self.required, jobs, attempts, time_budget, seed, cancel, progress)
+        for i, slot in enumerate(result.slots):
+            self.set_slot(i, slot)
+        return result
     
-    def assign_classrooms_to_slot(self, slot):
-        query = "SELECT Classroom.ClassroomID FROM Classroom JOIN 'Group' ON Classroom.SubjectID = 'Group'.SubjectID WHERE 'Group'.GroupID = ?"
-        classrooms = []
-        for groupid in slot:
-            result = [classroomid[0] for classroomid in self.db_manager.execute_query(query, (groupid,))]
-            for classroomid in result:
-                if classroomid not in classrooms:
-                    classrooms.append(classroomid)
-        return classrooms
-        
-
-    def save_to_table(self):
-        query = "DELETE FROM Schedule"
-        self.db_manager.execute_query(query)
-
-        query = "INSERT INTO Schedule (PeriodID, GroupID, ClassroomID) VALUES (?, ?, ?)"
+    def assign_slots_components(self, jobs=None, time_budget=None, seed=0, progress=None, cancel=None):
+        matrix = self.compat_manager.get_matrix()
+        components = matrix.components()
+        result = solve_components(self.dataset, matrix, len(self.slots), self.required, components, jobs, time_budget, seed, progress, cancel)
+        for i, slot in enumerate(result.slots):
+            self.set_slot(i, slot)
+        return result
+
+    def get_classrooms_by_group(self):
+        return {groupid: list(self.dataset.classrooms_for(groupid)) for groupid in self.dataset.group_ids}
+
+    def assign_classrooms_to_slot(self, slot, classrooms_by_group=None):
+        # classrooms[i] is the room for slot[i], matched so every group gets a
+        # room of its own subject where that is possible at all; groups left
+        # without one get None.
+        if classrooms_by_group is None:
+            classrooms_by_group = self.get_classrooms_by_group()
+        matches = hopcroft_karp([classrooms_by_group.get(groupid, []) for groupid in slot])
+        return [matches.get(i) for i in range(len(slot))]
+
+    def assign_classrooms(self):
+        classrooms_by_group = self.get_classrooms_by_group()
+        assignment = {}
+        unmatched = {}
+        for periodid, slot in enumerate(self.slots):
+            classrooms = self.assign_classrooms_to_slot(slot, classrooms_by_group)
+            for groupid, classroomid in zip(slot, classrooms):
+                assignment[(periodid, groupid)] = classroomid
+                if classroomid is None:
+                    unmatched.setdefault(periodid, []).append(groupid)
+        return assignment, unmatched
+
+    def get_schedule_rows(self):
+        assignment, self.unmatched_slots = self.assign_classrooms()
+        return [(periodid, groupid, classroomid) for (periodid, groupid), classroomid in assignment.items()]
+
+    def save_to_table(self, compile_to=None):
+        start = time.perf_counter()
+        with self.phase("assign_classrooms"):
+            rows = self.get_schedule_rows()
+        write_start = time.perf_counter()
+        with self.phase("save_to_table"), self.db_manager.transaction() as conn:
+            conn.execute("DELETE FROM Schedule")
+            conn.executemany("INSERT INTO Schedule (PeriodID, GroupID, ClassroomID) VALUES (?, ?, ?)", rows)
+        end = time.perf_counter()
+        report = {"rows": len(rows), "seconds": end - start, "write_seconds": end - write_start, "unmatched_slots": self.unmatched_slots}
+        if compile_to is not None:
+            from timetable_file import compile_timetable
+            with self.phase("compile_timetable"):
+                report["compiled"] = compile_timetable(self.db_manager, compile_to)
+        return report
+
+    def load_schedule(self):
+        self.slots = [[] for _ in range(self.dataset.num_slots)]
+        self.slot_rooms = [{} for _ in range(self.dataset.num_slots)]
+        for periodid, groupid, classroomid in self.db_manager.execute_query(ddl.SAVED_SCHEDULE_QUERY):
+            if 0 <= periodid < len(self.slots) and groupid in self.dataset.group_index:
+                self.slots[periodid].append(groupid)
+                self.slot_rooms[periodid][groupid] = classroomid
+        self.reset_counter()
+
+    def get_affected_groups(self, changed_pupils=None, changed_teachers=None):
+        if changed_pupils is None and changed_teachers is None:
+            return set(self.dataset.group_ids)
+        changed_pupils = set(changed_pupils or ())
+        changed_teachers = set(changed_teachers or ())
+        affected = set()
+        for i, groupid in enumerate(self.dataset.group_ids):
+            if self.dataset.group_teachers[i] in changed_teachers or not changed_pupils.isdisjoint(self.dataset.group_pupils[i]):
+                affected.add(groupid)
+        return affected
+
+    def find_free_classroom(self, periodid, groupid):
+        used = set(self.slot_rooms[periodid].values())
+        for classroomid in self.dataset.classrooms_for(groupid):
+            if classroomid not in used:
+                return classroomid
+        return None
+
+    def find_new_periods(self, matrix, periodid, groupid):
+        i = matrix.group_index[groupid]
+        options = []
+        for other, slot in enumerate(self.slots):
+            if other == periodid or groupid in slot:
+                continue
+            if matrix.to_mask(slot) & ~matrix.compatible[i]:
+                continue
+            classroomid = self.find_free_classroom(other, groupid)
+            if classroomid is not None:
+                options.append((other, classroomid))
+        return options
+
+    def repair(self, changed_pupils=None, changed_teachers=None):
+        # Re-places only the lessons of affected groups that now clash with
+        # another group in their period, using the enrolments currently in
+        # the database. Every other lesson stays where it is, and only the
+        # moved rows are rewritten.
+        start = time.perf_counter()
+        self.load_schedule()
+        matrix = self.compat_manager.get_matrix()
+        affected = self.get_affected_groups(changed_pupils, changed_teachers)
+
+        # While a period still has a clash, the clashing affected lesson with
+        # the most periods it could move to is moved. Lessons that fit nowhere
+        # else stay where they are, so a repair never drops lessons; they are
+        # reported as unresolved instead.
+        removed = []
+        placed = []
+        unresolved = []
         for periodid in range(len(self.slots)):
-            classrooms = self.assign_classrooms_to_slot(self.slots[periodid])
-            for i, groupid in enumerate(self.slots[periodid]):
-                classroomid = classrooms[i]
-                self.db_manager.execute_query(query, (periodid, groupid, classroomid,))
+            while True:
+                slot_mask = matrix.to_mask(self.slots[periodid])
+                clashing = []
+                for groupid in self.slots[periodid]:
+                    i = matrix.group_index[groupid]
+                    if groupid in affected and slot_mask & ~matrix.compatible[i] & ~(1 << i):
+                        clashing.append(groupid)
+                if not clashing:
+                    break
+                options = {groupid: self.find_new_periods(matrix, periodid, groupid) for groupid in clashing}
+                groupid = max(clashing, key=lambda groupid: len(options[groupid]))
+                if not options[groupid]:
+                    unresolved += [(periodid, groupid) for groupid in clashing]
+                    break
+                new_periodid, classroomid = options[groupid][0]
+                self.set_slot(periodid, [other for other in self.slots[periodid] if other != groupid])
+                self.slot_rooms[periodid].pop(groupid)
+                self.set_slot(new_periodid, self.slots[new_periodid] + [groupid])
+                self.slot_rooms[new_periodid][groupid] = classroomid
+                removed.append((periodid, groupid))
+                placed.append((new_periodid, groupid, classroomid))
+
+        with self.db_manager.transaction() as conn:
+            conn.executemany(ddl.DELETE_LESSON_QUERY, removed)
+            conn.executemany("INSERT INTO Schedule (PeriodID, GroupID, ClassroomID) VALUES (?, ?, ?)", placed)
+        return {"removed": removed, "placed": placed, "unresolved": unresolved, "seconds": time.perf_counter() - start}
 
 if __name__ == "__main__":
-    db_manager = DatabaseManager("neadb.db")
-    query = "SELECT MAX(PeriodNumber), MAX(Day) FROM Period"
-    
-    
\ No newline at end of file
+    import sys
+    from cli import main
+    sys.exit(main())
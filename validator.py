@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+import time
+from timetable_generator import DatabaseManager, SchoolDataset
+from solver import iter_bits
+
+def load_schedule_rows(db_manager):
+    return db_manager.execute_query("SELECT PeriodID, GroupID, ClassroomID FROM Schedule ORDER BY PeriodID")
+
+def validate_schedule(dataset, rows, classroom_subjects):
+    # Works per period with bitsets: each pupil gets one bit, and a pupil
+    # clash shows up as an overlap between a group's pupil mask and the
+    # union of the masks of the groups already seen in that period.
+    pupil_bits = {}
+    group_masks = []
+    for pupils in dataset.group_pupils:
+        mask = 0
+        for pupil_id in pupils:
+            mask |= 1 << pupil_bits.setdefault(pupil_id, len(pupil_bits))
+        group_masks.append(mask)
+    pupil_ids = sorted(pupil_bits, key=pupil_bits.get)
+
+    violations = {"unknown_group": [], "pupil_clash": [], "teacher_clash": [], "room_clash": [], "wrong_subject_room": [], "missing_room": []}
+    periods = {}
+    for periodid, groupid, classroomid in rows:
+        periods.setdefault(periodid, []).append((groupid, classroomid))
+
+    for periodid, lessons in periods.items():
+        seen_pupils = 0
+        pupil_owner = {}
+        teachers = {}
+        rooms = {}
+        for groupid, classroomid in lessons:
+            i = dataset.group_index.get(groupid)
+            if i is None:
+                violations["unknown_group"].append({"period": periodid, "group": groupid})
+                continue
+
+            overlap = seen_pupils & group_masks[i]
+            if overlap:
+                for bit in iter_bits(overlap):
+                    violations["pupil_clash"].append({"period": periodid, "pupil": pupil_ids[bit], "groups": [pupil_owner[bit], groupid]})
+            for bit in iter_bits(group_masks[i] & ~seen_pupils):
+                pupil_owner[bit] = groupid
+            seen_pupils |= group_masks[i]
+
+            teacher_id = dataset.group_teachers[i]
+            if teacher_id is not None:
+                if teacher_id in teachers:
+                    violations["teacher_clash"].append({"period": periodid, "teacher": teacher_id, "groups": [teachers[teacher_id], groupid]})
+                else:
+                    teachers[teacher_id] = groupid
+
+            if classroomid is None:
+                violations["missing_room"].append({"period": periodid, "group": groupid})
+                continue
+            if classroomid in rooms:
+                violations["room_clash"].append({"period": periodid, "classroom": classroomid, "groups": [rooms[classroomid], groupid]})
+            else:
+                rooms[classroomid] = groupid
+            if classroom_subjects.get(classroomid) != dataset.group_subjects[i]:
+                violations["wrong_subject_room"].append({"period": periodid, "group": groupid, "classroom": classroomid,
+                                                         "group_subject": dataset.group_subjects[i], "room_subject": classroom_subjects.get(classroomid)})
+    return violations
+
+def validate(db_file):
+    start = time.perf_counter()
+    db_manager = DatabaseManager(db_file)
+    dataset = SchoolDataset.load(db_manager)
+    rows = load_schedule_rows(db_manager)
+    classroom_subjects = {classroomid: subjectid for subjectid, classrooms in dataset.subject_classrooms.items() for classroomid in classrooms}
+    violations = validate_schedule(dataset, rows, classroom_subjects)
+    return {
+        "valid": not any(violations.values()),
+        "lessons": len(rows),
+        "counts": {kind: len(found) for kind, found in violations.items()},
+        "violations": violations,
+        "seconds": time.perf_counter() - start,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a saved timetable for clashes and room problems")
+    parser.add_argument("database")
+    parser.add_argument("--summary", action="store_true", help="print counts only")
+    args = parser.parse_args(argv)
+    report = validate(args.database)
+    if args.summary:
+        report = {key: value for key, value in report.items() if key != "violations"}
+    print(json.dumps(report, indent=2))
+    return 0 if report["valid"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())